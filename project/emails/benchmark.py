@@ -0,0 +1,374 @@
+import argparse
+from collections import Counter
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple
+)
+
+import networkx as nx
+import numpy as np
+
+from project.emails import checkpoint
+from project.emails import common
+from project.emails import csr
+from project.emails import distributions
+from project.emails import hyperanf
+from project.emails import robustness
+from project.emails import sir_model
+
+Results = Dict[str, Any]
+Dataset = Tuple[str, str]
+
+DEFAULT_SCALES = [10_000, 100_000, 1_000_000, 10_000_000]
+DEFAULT_SEED = 42
+DEFAULT_THRESHOLD = 0.2
+BA_EDGES_PER_NODE = 4
+
+# all-pairs shortest paths is quadratic in nodes, so it is measured on a fixed-size prefix of the graph;
+# the synthetic graphs share their prefix, so the case measures the same graph at every scale
+SHORTEST_PATHS_NODES = 300
+# the quadratic cases run on a prefix of this size on the graphs above their max_edges
+REDUCED_NODES = 1000
+
+
+class Case(NamedTuple):
+    """
+    run takes the graph (or what setup made of it, outside of the measurements) and a scratch folder.
+    On graphs above max_edges the case runs reduced instead, up to reduced_max_edges, or is skipped.
+    """
+    name: str
+    run: Callable[[Any, str], Any]
+    max_edges: int
+    repeats: int
+    setup: Optional[Callable[[nx.Graph], Any]] = None
+    reduced: Optional[Callable[[Any, str], Any]] = None
+    reduced_max_edges: int = 0
+
+
+def synthetic_ba_edges(edges_count: int, m: int = BA_EDGES_PER_NODE, seed: int = DEFAULT_SEED) -> np.ndarray:
+    """
+    :param edges_count: Number of edges to generate
+    :param m: Number of edges each new node brings
+    :param seed: Seed of the generator
+    :returns: (edges_count, 2) array of edges
+    Barabasi-Albert preferential attachment, sampling targets uniformly from the endpoints
+    of the edges created so far. Unlike nx.barabasi_albert_graph it is cheap enough for 10M edges,
+    and the same seed always yields the same prefix of the graph whatever the edges_count is.
+    """
+    rng = np.random.RandomState(seed)
+    nodes_count = edges_count // m + m
+    edges = np.empty((edges_count, 2), dtype=np.int64)
+    endpoints = np.empty(2 * edges_count, dtype=np.int64)
+
+    # the seed star: node m attaches to nodes 0..m-1
+    edges[:m, 0] = m
+    edges[:m, 1] = np.arange(m)
+    endpoints[:2 * m] = edges[:m].ravel()
+    filled = m
+
+    for node in range(m + 1, nodes_count):
+        if filled + m > edges_count:
+            break
+        targets = endpoints[rng.randint(0, 2 * filled, size=m)]
+        edges[filled:filled + m, 0] = node
+        edges[filled:filled + m, 1] = targets
+        endpoints[2 * filled:2 * (filled + m)] = edges[filled:filled + m].ravel()
+        filled += m
+
+    return edges[:filled]
+
+
+def synthetic_graph_path(edges_count: int, seed: int = DEFAULT_SEED) -> str:
+    path = os.path.join(common.SYNTHETIC_FOLDER, f'ba_{edges_count}_{seed}.csv')
+    if not os.path.exists(path):
+        os.makedirs(common.SYNTHETIC_FOLDER, exist_ok=True)
+        edges = synthetic_ba_edges(edges_count, seed=seed)
+        # same layout as the reduced graph exported from Gephi
+        np.savetxt(path, edges, fmt='%d', delimiter=' ', header='Source Target', comments='')
+    return path
+
+
+def _prefix_graph(graph: nx.Graph, nodes_count: int) -> nx.Graph:
+    nodes = sorted(graph.nodes())[:nodes_count]
+    return nx.convert_node_labels_to_integers(graph.subgraph(nodes))
+
+
+def _run_sir_step(graph: nx.Graph, out_dir: str) -> None:
+    sir_model.reset(graph)
+    sir_model.initialise_infection(graph, 10)
+    sir_model.execute_one_step(graph, sir_model.transmission_model_factory(0.05, 0.03))
+
+
+def _run_sir_simulation(graph: nx.Graph, out_dir: str, alpha: float = 0.2) -> None:
+    sir_model.reset(graph)
+    sir_model.run_spread_simulation(graph, sir_model.transmission_model_factory(0.6, alpha), 10)
+
+
+def _run_attack(graph: nx.Graph, out_dir: str) -> None:
+    robustness.robustness_by_attack(graph, 20, 10, history_path=os.path.join(out_dir, 'attack.txt'))
+
+
+def _degree_counts(graph: nx.Graph) -> Dict:
+    return dict(Counter(dict(graph.degree()).values()))
+
+
+def _run_hyperanf(graph: nx.Graph, out_dir: str) -> None:
+    _, adjacency = csr.undirected_from_edges(np.asarray(graph.edges(), dtype=np.int64))
+    hyperanf.hyperanf(adjacency)
+
+
+def default_cases() -> List[Case]:
+    return [
+        Case('degrees_distribution',
+             lambda g, _: distributions.degrees_distribution(g, show=False, return_values=True),
+             max_edges=10_000_000, repeats=3),
+        Case('log_binning',
+             lambda counts, _: distributions.log_binning(counts, 50),
+             max_edges=10_000_000, repeats=3, setup=_degree_counts),
+        Case('diameter_and_avg_path_length',
+             lambda g, _: robustness.diameter_and_avg_path_length(g),
+             max_edges=100_000, repeats=1,
+             reduced=lambda g, _: robustness.diameter_and_avg_path_length(_prefix_graph(g, REDUCED_NODES)),
+             reduced_max_edges=10_000_000),
+        Case('robustness_by_attack', _run_attack, max_edges=100_000, repeats=1,
+             reduced=lambda g, out: _run_attack(_prefix_graph(g, REDUCED_NODES), out),
+             reduced_max_edges=10_000_000),
+        Case('robustness_by_fail',
+             lambda g, out: robustness.robustness_by_fail(g, 2, 20, 10,
+                                                          history_path=os.path.join(out, 'fail.txt')),
+             max_edges=1_000_000, repeats=1),
+        Case('execute_one_step', _run_sir_step, max_edges=1_000_000, repeats=3),
+        # the reduced run removes the infected nodes faster, so the outbreak is shorter
+        Case('run_spread_simulation', _run_sir_simulation, max_edges=10_000, repeats=1,
+             reduced=lambda g, out: _run_sir_simulation(g, out, alpha=0.9), reduced_max_edges=1_000_000),
+        Case('calculate_shortest_paths',
+             lambda g, out: distributions.calculate_shortest_paths(_prefix_graph(g, SHORTEST_PATHS_NODES),
+                                                                   path=os.path.join(out, 'dist.txt')),
+             max_edges=10_000_000, repeats=1),
+        Case('hyperanf', _run_hyperanf, max_edges=10_000_000, repeats=1),
+    ]
+
+
+def _measure(func: Callable[[], Any], repeats: int, seed: int) -> Tuple[List[float], int]:
+    """
+    The random generator is reseeded before every call, so all the runs do the same work.
+    """
+    timings = []
+    for _ in range(repeats):
+        random.seed(seed)
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+
+    # tracemalloc slows everything down, so the peak is taken on a separate run
+    random.seed(seed)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return timings, peak
+
+
+def _quiet(func: Callable[[], Any]) -> Callable[[], Any]:
+    def wrapped() -> Any:
+        stdout, stderr = sys.stdout, sys.stderr
+        with open(os.devnull, 'w') as devnull:
+            sys.stdout = sys.stderr = devnull
+            try:
+                return func()
+            finally:
+                sys.stdout, sys.stderr = stdout, stderr
+
+    return wrapped
+
+
+def _load_case(path: str) -> Tuple[Results, nx.Graph]:
+    started = time.perf_counter()
+    graph = distributions.graph_from_gephi_edge_list(path)
+    elapsed = time.perf_counter() - started
+
+    # the timed copy is dropped first, so the peak is the one of a single load
+    del graph
+    gc.collect()
+    tracemalloc.start()
+    try:
+        graph = distributions.graph_from_gephi_edge_list(path)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    result = {
+        'case': 'graph_from_gephi_edge_list',
+        'status': 'ok',
+        'seconds': [elapsed],
+        'best': elapsed,
+        'median': elapsed,
+        'peak_memory_bytes': peak,
+    }
+    return result, graph
+
+
+def run_case(case: Case, graph: nx.Graph, edges_count: int, out_dir: str, seed: int) -> Results:
+    """
+    :returns: Timings and peak memory of the case; its status is 'skipped' on a graph too large for it
+              and 'error' if it raised, the other cases still run
+    """
+    result: Results = {'case': case.name, 'reduced': edges_count > case.max_edges}
+    run = case.reduced if result['reduced'] else case.run
+    if run is None or edges_count > max(case.max_edges, case.reduced_max_edges):
+        result['status'] = 'skipped'
+        return result
+
+    try:
+        data = case.setup(graph) if case.setup is not None else graph
+        timings, peak = _measure(_quiet(lambda: run(data, out_dir)), case.repeats, seed)
+    except Exception as error:
+        result.update({'status': 'error', 'error': repr(error)})
+        return result
+
+    result.update({
+        'status': 'ok',
+        'seconds': timings,
+        'best': min(timings),
+        'median': statistics.median(timings),
+        'peak_memory_bytes': peak,
+    })
+    return result
+
+
+def run_dataset(dataset: str, path: str, cases: List[Case], seed: int) -> List[Results]:
+    print(f'---- Dataset: {dataset} ----')
+    load, graph = _load_case(path)
+    edges_count = graph.number_of_edges()
+    nodes_count = graph.number_of_nodes()
+
+    results = [load]
+    with tempfile.TemporaryDirectory() as out_dir:
+        for case in cases:
+            result = run_case(case, graph, edges_count, out_dir, seed)
+            results.append(result)
+            print(f'{case.name}: {result.get("best", result["status"])}')
+
+    for result in results:
+        result.update({'dataset': dataset, 'nodes': nodes_count, 'edges': edges_count})
+    return results
+
+
+def datasets(scales: List[int], seed: int, with_enron: bool = True) -> List[Dataset]:
+    result = [('enron', common.REDUCED_GRAPH_PATH)] if with_enron else []
+    result += [(f'ba_{scale}', synthetic_graph_path(scale, seed)) for scale in scales]
+    return result
+
+
+def run_benchmarks(scales: Optional[List[int]] = None, seed: int = DEFAULT_SEED,
+                   case_names: Optional[List[str]] = None, with_enron: bool = True,
+                   output: Optional[str] = None) -> Results:
+    """
+    :param output: File to write the results to after every dataset, so an interrupted run keeps the finished ones
+    """
+    if scales is None:
+        scales = DEFAULT_SCALES
+
+    cases = [case for case in default_cases() if case_names is None or case.name in case_names]
+
+    results: List[Results] = []
+    report = {'meta': _meta(seed), 'results': results}
+    for dataset, path in datasets(scales, seed, with_enron):
+        results += run_dataset(dataset, path, cases, seed)
+        if output is not None:
+            dump_results(output, report)
+    return report
+
+
+def _meta(seed: int) -> Results:
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'networkx': nx.__version__,
+        'numpy': np.__version__,
+        'seed': seed,
+    }
+
+
+def dump_results(path: str, results: Results) -> None:
+    with checkpoint.atomic_open(path) as file:
+        json.dump(results, file, indent=2)
+
+
+def load_results(path: str) -> Results:
+    with open(path) as file:
+        return json.load(file)
+
+
+def compare(current: Results, baseline: Results, threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """
+    :param current: Results of the current run
+    :param baseline: Results of the reference run
+    :param threshold: Allowed relative slowdown (or memory growth), 0.2 means 20%
+    :returns: Human readable descriptions of the regressions, empty if there are none
+    """
+    def key(res: Results) -> Tuple[str, str, bool]:
+        return res['dataset'], res['case'], res.get('reduced', False)
+
+    reference = {key(res): res for res in baseline['results'] if res['status'] == 'ok'}
+
+    regressions = []
+    for res in current['results']:
+        ref = reference.get(key(res))
+        if res['status'] != 'ok' or ref is None:
+            continue
+        for metric in ['best', 'peak_memory_bytes']:
+            if res[metric] is None or not ref[metric]:
+                continue
+            ratio = res[metric] / ref[metric]
+            if ratio > 1 + threshold:
+                regressions.append(f'{res["dataset"]}/{res["case"]}: {metric} {ref[metric]:.4g} -> '
+                                   f'{res[metric]:.4g} (x{ratio:.2f})')
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Benchmarks of the emails network analysis')
+    parser.add_argument('--scales', type=int, nargs='*', default=DEFAULT_SCALES,
+                        help='edges counts of the synthetic Barabasi-Albert graphs')
+    parser.add_argument('--cases', nargs='*', default=None, help='names of the cases to run, all by default')
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED)
+    parser.add_argument('--no-enron', action='store_true', help='skip the bundled Enron graph')
+    parser.add_argument('--output', default=os.path.join(common.BENCHMARKS_FOLDER, 'results.json'))
+    parser.add_argument('--baseline', default=None, help='results to check the current run against')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.scales, args.seed, args.cases, not args.no_enron, args.output)
+
+    if args.baseline is not None:
+        regressions = compare(results, load_results(args.baseline), args.threshold)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+from contextlib import contextmanager
+import hashlib
+import os
+import pickle
+import tempfile
+from typing import (
+    Any,
+    Dict,
+    IO,
+    Iterator,
+    Optional,
+    Set
+)
+
+import numpy as np
+
+State = Dict[str, Any]
+Artifact = Dict[str, np.ndarray]
+
+MANIFEST_NAME = 'manifest.pkl'
+CHUNK_PREFIX = 'chunk_'
+TMP_PREFIX = '.tmp_'
+
+
+@contextmanager
+def atomic_open(path: str, mode: str = 'w') -> Iterator[IO]:
+    """
+    :param path: Destination file
+    :param mode: Writing mode, 'w' or 'wb'
+    Writes into a temporary file of the same folder and renames it over the destination on success,
+    so a crash leaves either the previous content or the new one, never a half-written file.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=folder, prefix=TMP_PREFIX)
+    # mkstemp creates private files, the result should get the usual permissions
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_path, 0o666 & ~umask)
+    try:
+        with os.fdopen(fd, mode) as file:
+            yield file
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    with atomic_open(path, 'wb') as file:
+        file.write(data)
+
+
+def save_artifact(path: str, artifact: Artifact) -> None:
+    arrays: Dict[str, Any] = dict(artifact)
+    with atomic_open(path, 'wb') as file:
+        np.savez(file, **arrays)
+
+
+def load_artifact(path: str) -> Artifact:
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def save(path: str, state: State) -> None:
+    atomic_write(path, pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def load(path: str, params: Optional[State] = None) -> Optional[State]:
+    """
+    :param path: Checkpoint file
+    :param params: Parameters of the job; a checkpoint saved with other parameters is ignored
+    :returns: Saved state or None if there is nothing to resume
+    """
+    if not os.path.exists(path):
+        return None
+    with open(path, 'rb') as file:
+        state = pickle.load(file)
+    if params is not None and state.get('params') != params:
+        return None
+    return state
+
+
+def remove(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def graph_fingerprint(graph: Any) -> str:
+    """
+    :param graph: networkx graph of comparable nodes
+    :returns: Hash of the node order and the sorted edge list; the jobs index and sample nodes in the
+              iteration order, so two graphs with the same edges but another node order are different jobs
+    """
+    digest = hashlib.sha256()
+    digest.update(repr(list(graph.nodes())).encode())
+    digest.update(repr(sorted(tuple(sorted(edge)) for edge in graph.edges())).encode())
+    return digest.hexdigest()
+
+
+def _is_job_file(name: str) -> bool:
+    return name == MANIFEST_NAME or name.startswith(CHUNK_PREFIX) or name.startswith(TMP_PREFIX)
+
+
+def prepare_chunks(folder: str, params: State) -> Set[int]:
+    """
+    :param folder: Folder holding the chunks of a job, either new, empty or used by a job before
+    :param params: Parameters of the job
+    :returns: Indexes of the chunks already done
+    Chunks left by a job with different parameters are discarded. Only the files of the jobs are ever removed,
+    a non-empty folder without a manifest is refused.
+    """
+    manifest = os.path.join(folder, MANIFEST_NAME)
+    if os.path.isdir(folder) and not os.path.exists(manifest) and os.listdir(folder):
+        raise ValueError(f'{folder} is not empty and holds no checkpoint, use a dedicated folder')
+
+    if load(manifest, params) is None:
+        remove_chunks(folder)
+        save(manifest, {'params': params})
+        return set()
+
+    return {int(name[len(CHUNK_PREFIX):-len('.pkl')]) for name in os.listdir(folder)
+            if name.startswith(CHUNK_PREFIX)}
+
+
+def chunk_path(folder: str, idx: int) -> str:
+    return os.path.join(folder, f'{CHUNK_PREFIX}{idx}.pkl')
+
+
+def save_chunk(folder: str, idx: int, data: Any) -> None:
+    atomic_write(chunk_path(folder, idx), pickle.dumps(data, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def load_chunk(folder: str, idx: int) -> Any:
+    with open(chunk_path(folder, idx), 'rb') as file:
+        return pickle.load(file)
+
+
+def remove_chunks(folder: str) -> None:
+    """
+    Removes the manifest, chunks and temporary files of a job, and the folder if nothing else is left.
+    """
+    if not os.path.isdir(folder):
+        return
+    for name in os.listdir(folder):
+        if _is_job_file(name):
+            os.remove(os.path.join(folder, name))
+    if not os.listdir(folder):
+        os.rmdir(folder)
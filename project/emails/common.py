@@ -1,5 +1,8 @@
 import os
-from typing import Iterable
+from typing import (
+    Any,
+    Iterable
+)
 
 ROOT_FOLDER = os.path.dirname(os.path.dirname(__file__))
 
@@ -10,6 +13,7 @@ GRAPH_PATH = os.path.join(DATA_FOLDER, 'emails.txt')
 EXTENDED_BA_PATH = os.path.join(DATA_FOLDER, 'extended_ba.csv')
 REDUCED_GRAPH_PATH = os.path.join(DATA_FOLDER, 'reduced_graph.csv')
 GEPHI_METRICS = os.path.join(DATA_FOLDER, 'gephi_metrics.csv')
+DISTANCES_PATH = os.path.join(DATA_FOLDER, 'dist.txt')
 
 ROBUSTNESS_FOLDER = os.path.join(DATA_FOLDER, 'robustness')
 ROBUSTNESS_ATTACK_FOLDER = os.path.join(ROBUSTNESS_FOLDER, 'attack')
@@ -17,9 +21,29 @@ ROBUSTNESS_FAIL_FOLDER = os.path.join(ROBUSTNESS_FOLDER, 'fail')
 
 ROBUSTNESS_ATTACK_HISTORY = os.path.join(ROBUSTNESS_ATTACK_FOLDER, 'attack_history.txt')
 ROBUSTNESS_FAIL_HISTORY = os.path.join(ROBUSTNESS_FAIL_FOLDER, 'fail_history.txt')
+ROBUSTNESS_FAIL_CHECKPOINT = os.path.join(ROBUSTNESS_FAIL_FOLDER, 'fail_checkpoint.pkl')
 
 SIR_FOLDER = os.path.join(DATA_FOLDER, 'sir')
 
+TRACES_FOLDER = os.path.join(DATA_FOLDER, 'traces')
+
+CACHE_FOLDER = os.path.join(DATA_FOLDER, 'cache')
+
+BENCHMARKS_FOLDER = os.path.join(DATA_FOLDER, 'benchmarks')
+SYNTHETIC_FOLDER = os.path.join(BENCHMARKS_FOLDER, 'synthetic')
+
 
 def join_values(values: Iterable, sep: str = ' ') -> str:
     return sep.join([str(val) for val in values])
+
+
+def sir_history_path(experiment: str, run: int) -> str:
+    return os.path.join(SIR_FOLDER, experiment, f'sir_history_{run}.txt')
+
+
+def pyplot() -> Any:
+    """
+    Imports matplotlib only when a figure is actually drawn, compute-only runs never pay for it.
+    """
+    import matplotlib.pyplot as plt
+    return plt
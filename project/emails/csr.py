@@ -0,0 +1,128 @@
+from typing import (
+    NamedTuple,
+    Optional,
+    Tuple
+)
+
+import numpy as np
+
+
+class CSR(NamedTuple):
+    """
+    Compressed sparse row adjacency: the neighbours of node i are indices[indptr[i]:indptr[i + 1]].
+    """
+    indptr: np.ndarray
+    indices: np.ndarray
+
+    @property
+    def nodes_count(self) -> int:
+        return len(self.indptr) - 1
+
+    @property
+    def edges_count(self) -> int:
+        return len(self.indices)
+
+    def degrees(self) -> np.ndarray:
+        return np.diff(self.indptr)
+
+    def sources(self) -> np.ndarray:
+        """
+        Source node of every entry of indices.
+        """
+        return np.repeat(np.arange(self.nodes_count), self.degrees())
+
+
+def edges_from_file(path: str, delimiter: Optional[str] = '\t') -> np.ndarray:
+    """
+    :param path: Edge list with a header line, e.g. emails.txt or an edge list exported from Gephi
+    :param delimiter: Column separator, None for any whitespace
+    :returns: (edges, 2) array of the raw node ids
+    """
+    with open(path, 'r') as file:
+        next(file, '')
+        edges = np.loadtxt(file, dtype=np.int64, delimiter=delimiter, ndmin=2)
+    return edges
+
+
+def relabel(edges: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param edges: (edges, 2) array of node ids
+    :returns: labels (original id of every node index) and the edges over the indexes 0..n-1
+    """
+    labels, inverse = np.unique(edges, return_inverse=True)
+    return labels, inverse.reshape(edges.shape)
+
+
+def csr_from_edges(sources: np.ndarray, targets: np.ndarray, nodes_count: int) -> CSR:
+    """
+    :param sources: Source node index of every edge
+    :param targets: Target node index of every edge
+    :param nodes_count: Number of nodes
+    Builds the adjacency of a simple graph: self-loops and repeated edges are dropped,
+    neighbours of every node are sorted.
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    targets = np.asarray(targets, dtype=np.int64)
+    keep = sources != targets
+    keys = np.unique(sources[keep] * nodes_count + targets[keep])
+
+    indptr = np.zeros(nodes_count + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // nodes_count, minlength=nodes_count), out=indptr[1:])
+    return CSR(indptr, keys % nodes_count)
+
+
+def reverse(csr: CSR) -> CSR:
+    return csr_from_edges(csr.indices, csr.sources(), csr.nodes_count)
+
+
+def undirected(csr: CSR) -> CSR:
+    sources = csr.sources()
+    return csr_from_edges(np.concatenate([sources, csr.indices]), np.concatenate([csr.indices, sources]),
+                          csr.nodes_count)
+
+
+def undirected_from_edges(edges: np.ndarray) -> Tuple[np.ndarray, CSR]:
+    """
+    :param edges: (edges, 2) array of node ids
+    :returns: labels (original id of every node index) and the undirected adjacency over the indexes
+    """
+    labels, edges = relabel(edges)
+    sources, targets = edges[:, 0], edges[:, 1]
+    return labels, csr_from_edges(np.concatenate([sources, targets]), np.concatenate([targets, sources]), len(labels))
+
+
+def neighbours_of(csr: CSR, nodes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param csr: Adjacency
+    :param nodes: Node indexes
+    :returns: For every edge leaving the given nodes, its source and its target
+    Vectorised gather of the adjacency slices, the building block of the frontier expansions.
+    """
+    starts = csr.indptr[nodes]
+    lengths = csr.indptr[nodes + 1] - starts
+    total = int(lengths.sum())
+    if total == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+
+    offsets = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    positions = offsets + np.arange(total)
+    return np.repeat(nodes, lengths), csr.indices[positions]
+
+
+def bfs_distances(csr: CSR, source: int) -> np.ndarray:
+    """
+    :param csr: Adjacency, the search follows the edges from source to target
+    :param source: Node index to start from
+    :returns: Distance from the source to every node, -1 for the unreachable ones
+    """
+    distances = np.full(csr.nodes_count, -1, dtype=np.int64)
+    distances[source] = 0
+    frontier = np.array([source], dtype=np.int64)
+    depth = 0
+    while len(frontier):
+        depth += 1
+        _, targets = neighbours_of(csr, frontier)
+        targets = np.unique(targets[distances[targets] < 0])
+        distances[targets] = depth
+        frontier = targets
+    return distances
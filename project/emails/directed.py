@@ -0,0 +1,241 @@
+from collections import Counter
+from typing import (
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple
+)
+
+import numpy as np
+
+from project.emails import common
+from project.emails import csr
+from project.emails import instrumentation
+from project.emails.csr import CSR
+from project.emails.distributions import log_binning_arrays
+from project.emails.sir_model import State
+
+Binned = Tuple[np.ndarray, np.ndarray]
+SirResults = Tuple[List[int], List[int], List[int], int, List[int]]
+
+
+class DirectedGraph(NamedTuple):
+    """
+    Directed graph as a pair of adjacencies: forward follows the emails from sender to recipient,
+    reverse from recipient to sender. labels[i] is the original id of the node index i.
+    """
+    forward: CSR
+    reverse: CSR
+    labels: np.ndarray
+
+
+def directed_graph_from_edges(edges: np.ndarray) -> DirectedGraph:
+    labels, indexed = csr.relabel(edges)
+    forward = csr.csr_from_edges(indexed[:, 0], indexed[:, 1], len(labels))
+    return DirectedGraph(forward, csr.reverse(forward), labels)
+
+
+def directed_graph_from_file(path: Optional[str] = None) -> DirectedGraph:
+    if path is None:
+        path = common.GRAPH_PATH
+    return directed_graph_from_edges(csr.edges_from_file(path))
+
+
+def in_degrees(graph: DirectedGraph) -> np.ndarray:
+    return graph.reverse.degrees()
+
+
+def out_degrees(graph: DirectedGraph) -> np.ndarray:
+    return graph.forward.degrees()
+
+
+def reciprocal_degrees(graph: DirectedGraph) -> np.ndarray:
+    """
+    Number of neighbours every node both sends emails to and receives emails from.
+    """
+    n = graph.forward.nodes_count
+    sources = graph.forward.sources()
+    targets = graph.forward.indices
+    # forward.indices are sorted within every node, so the edge keys are sorted as a whole
+    keys = sources * n + targets
+    reciprocal = np.isin(targets * n + sources, keys, assume_unique=True)
+    return np.bincount(sources[reciprocal], minlength=n)
+
+
+def degree_distributions(graph: DirectedGraph, bin_count: int = 50) -> Dict[str, Binned]:
+    """
+    :returns: Log-binned in, out and reciprocal degree distributions, nodes of zero degree are left out
+    """
+    distributions = {}
+    for name, degrees in [('in', in_degrees(graph)), ('out', out_degrees(graph)),
+                          ('reciprocal', reciprocal_degrees(graph))]:
+        keys, counts = np.unique(degrees[degrees > 0], return_counts=True)
+        distributions[name] = log_binning_arrays(keys.astype(float), counts.astype(float), bin_count)
+    return distributions
+
+
+class _Tarjan:
+    """
+    Tarjan's algorithm with an explicit stack of (node, next edge position) frames instead of recursion.
+    """
+
+    def __init__(self, adjacency: CSR) -> None:
+        n = adjacency.nodes_count
+        self.indptr = adjacency.indptr.tolist()
+        self.indices = adjacency.indices.tolist()
+        self.index = [-1] * n
+        self.low = [0] * n
+        self.on_stack = [False] * n
+        self.stack: List[int] = []
+        self.labels = [-1] * n
+        self.counter = 0
+        self.components = 0
+
+    def _open(self, node: int, frames: List[Tuple[int, int]]) -> None:
+        self.index[node] = self.low[node] = self.counter
+        self.counter += 1
+        self.stack.append(node)
+        self.on_stack[node] = True
+        frames.append((node, self.indptr[node]))
+
+    def _close(self, node: int) -> None:
+        if self.low[node] != self.index[node]:
+            return
+        while True:
+            member = self.stack.pop()
+            self.on_stack[member] = False
+            self.labels[member] = self.components
+            if member == node:
+                break
+        self.components += 1
+
+    def _advance(self, frames: List[Tuple[int, int]]) -> bool:
+        """
+        Explores the next edge of the top frame, returns False when the node has no edges left.
+        """
+        node, position = frames[-1]
+        end = self.indptr[node + 1]
+        while position < end:
+            target = self.indices[position]
+            position += 1
+            if self.index[target] < 0:
+                frames[-1] = (node, position)
+                self._open(target, frames)
+                return True
+            if self.on_stack[target]:
+                self.low[node] = min(self.low[node], self.index[target])
+        return False
+
+    def run(self) -> np.ndarray:
+        for root in range(len(self.index)):
+            if self.index[root] >= 0:
+                continue
+            frames: List[Tuple[int, int]] = []
+            self._open(root, frames)
+            while frames:
+                if self._advance(frames):
+                    continue
+                node, _ = frames.pop()
+                self._close(node)
+                if frames:
+                    parent = frames[-1][0]
+                    self.low[parent] = min(self.low[parent], self.low[node])
+        return np.asarray(self.labels, dtype=np.int64)
+
+
+def strongly_connected_components(graph: DirectedGraph) -> np.ndarray:
+    """
+    :returns: Component label of every node, labels are numbered in reverse topological order
+    """
+    with instrumentation.span('strongly_connected_components', nodes=graph.forward.nodes_count):
+        return _Tarjan(graph.forward).run()
+
+
+def component_sizes(labels: np.ndarray) -> np.ndarray:
+    return np.sort(np.bincount(labels))[::-1]
+
+
+def distance_histogram(graph: DirectedGraph, sources: Optional[Iterable[int]] = None,
+                       reverse: bool = False) -> Counter:
+    """
+    :param graph: Directed graph
+    :param sources: Node indexes to start the searches from, all nodes by default (O(n * m))
+    :param reverse: Follow the edges from recipient to sender
+    :returns: Number of ordered (source, target) pairs at every distance, unreachable pairs are left out;
+              the same format as distributions.distances_counter
+    """
+    adjacency = graph.reverse if reverse else graph.forward
+    if sources is None:
+        sources = range(adjacency.nodes_count)
+
+    dist_by_val: Counter = Counter()
+    with instrumentation.span('directed_distance_histogram', reverse=reverse):
+        for done, source in enumerate(sources, 1):
+            distances = csr.bfs_distances(adjacency, source)
+            values, counts = np.unique(distances[distances > 0], return_counts=True)
+            dist_by_val.update(dict(zip(values.tolist(), counts.tolist())))
+            instrumentation.count('bfs_runs')
+            instrumentation.progress('directed_distance_histogram', done)
+    return dist_by_val
+
+
+def run_directed_spread_simulation(graph: DirectedGraph, beta: float, alpha: float,
+                                   initial_infection_count: int = 10,
+                                   initially_infected: Optional[Sequence[int]] = None,
+                                   seed: Optional[int] = None) -> SirResults:
+    """
+    :param graph: Directed graph, the infection travels from sender to recipient
+    :param beta: specifies the rate of infection (movement from S to I)
+    :param alpha: specifies the rate of removal (movement from I to R)
+    :param initial_infection_count: Number of random nodes to infect, unless initially_infected is given
+    :param initially_infected: Node indexes to infect at the start
+    :param seed: Seed of the random generator
+    :returns: the same 5-tuple as sir_model.run_spread_simulation: S, I, R counts per time step,
+              the end time and the initially infected nodes
+    The transmission model of sir_model.transmission_model_factory over the arrays: every step each infected node
+    infects each susceptible out-neighbour with probability beta and is then removed with probability alpha.
+    """
+    rng = np.random.RandomState(seed)
+    n = graph.forward.nodes_count
+    if initially_infected is None:
+        initially_infected = rng.choice(n, initial_infection_count, replace=False).tolist()
+
+    states = np.full(n, State.SUSCEPTIBLE.value, dtype=np.int8)
+    states[np.asarray(initially_infected, dtype=np.int64)] = State.INFECTED.value
+
+    s_results: List[int] = []
+    i_results: List[int] = []
+    r_results: List[int] = []
+    infected = np.flatnonzero(states == State.INFECTED.value)
+    dt = 0
+    while len(infected) > 0:
+        _, targets = csr.neighbours_of(graph.forward, infected)
+        targets = targets[states[targets] == State.SUSCEPTIBLE.value]
+        newly_infected = targets[rng.random_sample(len(targets)) <= beta]
+        newly_removed = infected[rng.random_sample(len(infected)) <= alpha]
+        instrumentation.count('rng_draws', len(targets) + len(infected))
+
+        states[newly_infected] = State.INFECTED.value
+        states[newly_removed] = State.REMOVED.value
+        dt += 1
+
+        counts = np.bincount(states, minlength=3)
+        s_results.append(int(counts[State.SUSCEPTIBLE.value]))
+        i_results.append(int(counts[State.INFECTED.value]))
+        r_results.append(int(counts[State.REMOVED.value]))
+        instrumentation.progress('directed_sir', dt, infected=i_results[-1])
+
+        infected = np.flatnonzero(states == State.INFECTED.value)
+
+    return s_results, i_results, r_results, dt, list(initially_infected)
+
+
+if __name__ == '__main__':
+    g = directed_graph_from_file()
+    print(f'nodes: {g.forward.nodes_count}; edges: {g.forward.edges_count}')
+    print(f'reciprocal edges: {reciprocal_degrees(g).sum()}')
+    sizes = component_sizes(strongly_connected_components(g))
+    print(f'strongly connected components: {len(sizes)}; largest: {sizes[:5]}')
@@ -10,16 +10,23 @@ from typing import (
     Dict,
     List,
     Optional,
+    Sequence,
+    Set,
     Tuple
 )
 
-import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
 
+from project.emails import checkpoint
 from project.emails import common
+from project.emails import instrumentation
+from project.emails.instrumentation import TraceState
 
 Edge = Tuple[int, int]
+Binned = Tuple[np.ndarray, np.ndarray]
+
+DEFAULT_SOURCES_PER_CHUNK = 1000
 
 
 def graph_instance() -> nx.Graph:
@@ -37,40 +44,56 @@ def edges_from_file(path: str) -> List[Edge]:
     return edges
 
 
-def log_binning(counter_dict: Dict, bin_count: int = 35) -> Tuple[float, float]:
-    keys = counter_dict.keys()
-    values = counter_dict.values()
+def log_binning(counter_dict: Dict, bin_count: int = 35) -> Tuple[np.ndarray, np.ndarray]:
+    keys = np.fromiter(counter_dict.keys(), dtype=float, count=len(counter_dict))
+    values = np.fromiter(counter_dict.values(), dtype=float, count=len(counter_dict))
+    return log_binning_arrays(keys, values, bin_count)
 
-    max_x = math.log10(max(keys))
-    max_y = math.log10(max(values))
-    max_base = max([max_x, max_y])
 
-    min_x = math.log10(min(filter(lambda v: v > 0, keys)))
+def log_binning_arrays(keys: np.ndarray, values: np.ndarray, bin_count: int = 35) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    :param keys: Observed values, e.g. degrees
+    :param values: How many times every key was observed
+    :param bin_count: Number of logarithmic bins
+    :returns: Mean key and mean value of every bin
+    log_binning over arrays, e.g. the output of np.unique(..., return_counts=True).
+    """
+    max_base = math.log10(max(keys.max(), values.max()))
+    min_x = math.log10(keys[keys > 0].min())
 
     bins = np.logspace(min_x, max_base, num=bin_count)
 
-    bin_means_y = (np.histogram(list(keys), bins, weights=list(values))[0] /
-                   np.histogram(list(keys), bins)[0])
-    bin_means_x = (np.histogram(list(keys), bins, weights=list(keys))[0] /
-                   np.histogram(list(keys), bins)[0])
+    counts = np.histogram(keys, bins)[0]
+    bin_means_y = np.histogram(keys, bins, weights=values)[0] / counts
+    bin_means_x = np.histogram(keys, bins, weights=keys)[0] / counts
 
     return bin_means_x, bin_means_y
 
 
-def degrees_distribution(graph: nx.Graph, show: bool = False,
-                         return_values: bool = False) -> Optional[Tuple[float, float]]:
+def degrees_binned(graph: nx.Graph) -> Binned:
     degs = sorted(list(dict(graph.degree([node for node in graph.nodes()])).values()), reverse=True)
+    return log_binning(dict(Counter(degs)), 50)
+
+
+def plot_degrees(deg_x: np.ndarray, deg_y: np.ndarray) -> None:
+    plt = common.pyplot()
+
+    plt.figure()
+    plt.scatter(deg_x, deg_y, c='r', marker='s', s=25, label='')
+    plt.xscale('log')
+    plt.yscale('log')
+    plt.title('Degrees Distribution')
+    plt.xlabel('k')
+    plt.ylabel('Count')
 
-    deg_x, deg_y = log_binning(dict(Counter(degs)), 50)
+
+def degrees_distribution(graph: nx.Graph, show: bool = False,
+                         return_values: bool = False) -> Optional[Binned]:
+    deg_x, deg_y = degrees_binned(graph)
 
     if show:
-        plt.figure()
-        plt.scatter(deg_x, deg_y, c='r', marker='s', s=25, label='')
-        plt.xscale('log')
-        plt.yscale('log')
-        plt.title('Degrees Distribution')
-        plt.xlabel('k')
-        plt.ylabel('Count')
+        plt = common.pyplot()
+        plot_degrees(deg_x, deg_y)
         plt.show()
         plt.savefig(os.path.join(common.FIGURES_FOLDER, 'degrees_distribution.png'))
 
@@ -84,69 +107,99 @@ def average_degree(graph: nx.Graph) -> float:
     return sum(degs) / len(graph.nodes())
 
 
-def giant_components_distribution(graph: nx.Graph, dump_reduced: bool = False) -> None:
-    fractions = []
+def components_by_size(graph: nx.Graph) -> List[nx.Graph]:
+    return sorted(nx.connected_component_subgraphs(graph), key=len, reverse=True)
 
-    components = sorted(nx.connected_component_subgraphs(graph), key=len, reverse=True)
 
-    if dump_reduced:
-        dump_graph(components[0], path=common.REDUCED_GRAPH_PATH)
+def component_fractions(graph: nx.Graph, components: List[nx.Graph]) -> List[float]:
+    return [len(sub.nodes()) / len(graph.nodes()) for sub in components]
 
-    for sub in components:
-        fraction = len(sub.nodes()) / len(graph.nodes())
-        print(f'Component fraction: {round(fraction, 5)} with nodes: {len(graph.nodes())}; edges: {len(sub.edges())}')
-        fractions.append(fraction)
 
-    idxs = np.arange(len(fractions))
+def plot_components(fractions: Sequence[float], fractions_to: int = 10) -> None:
+    plt = common.pyplot()
 
-    fractions_to = 10
+    idxs = np.arange(len(fractions))
 
+    plt.figure()
     plt.bar(idxs[:fractions_to], fractions[:fractions_to], width=0.5, color='b', label='Fraction of nodes')
     plt.title('Nodes distribution by components')
     plt.ylabel('Fraction')
     plt.yscale('log')
     plt.xticks(idxs[:fractions_to])
+
+
+def giant_components_distribution(graph: nx.Graph, dump_reduced: bool = False) -> None:
+    plt = common.pyplot()
+
+    components = components_by_size(graph)
+
+    if dump_reduced:
+        dump_graph(components[0], path=common.REDUCED_GRAPH_PATH)
+
+    fractions = component_fractions(graph, components)
+    for sub, fraction in zip(components, fractions):
+        print(f'Component fraction: {round(fraction, 5)} with nodes: {len(graph.nodes())}; edges: {len(sub.edges())}')
+
+    plot_components(fractions)
     plt.savefig(os.path.join(common.FIGURES_FOLDER, 'components_distribution.png'))
 
 
-def clustering_distribution_from_gephi(path: Optional[str] = None) -> None:
+def gephi_metric(column: str, path: Optional[str] = None) -> List[float]:
+    """
+    :param column: Column of the metrics exported from Gephi, e.g. clustering or betweenesscentrality
+    """
     if path is None:
         path = common.GEPHI_METRICS
 
-    clustering_coeffs = []
     with open(path) as file:
         reader = csv.DictReader(file, delimiter=',')
-        for line in reader:
-            clustering_coeffs.append(float(line['clustering']))
+        return [float(line[column]) for line in reader]
+
+
+def clustering_binned(path: Optional[str] = None) -> Binned:
+    clustering_coeffs = sorted(gephi_metric('clustering', path))
+    return log_binning(dict(Counter(clustering_coeffs)), 70)
+
 
-    clustering_coeffs = sorted(clustering_coeffs)
-    clust_x, clust_y = log_binning(dict(Counter(clustering_coeffs)), 70)
+def plot_clustering(clust_x: np.ndarray, clust_y: np.ndarray) -> None:
+    plt = common.pyplot()
 
+    plt.figure()
     plt.scatter(clust_x, clust_y, c='r', marker='s', s=25, label='')
     plt.yscale('log')
     plt.xlim(0, 1.01)
     plt.title('Local clustering coefficient distribution')
     plt.ylabel('Count')
     plt.xlabel('Clustering coefficient')
+
+
+def clustering_distribution_from_gephi(path: Optional[str] = None) -> None:
+    plt = common.pyplot()
+
+    plot_clustering(*clustering_binned(path))
     plt.savefig(os.path.join(common.FIGURES_FOLDER, 'clustering_distribution.png'))
 
 
-def betweenness_distribution_from_gephi(path: Optional[str] = None) -> None:
-    if path is None:
-        path = common.GEPHI_METRICS
+def betweenness_binned(path: Optional[str] = None) -> Binned:
+    return log_binning(dict(Counter(gephi_metric('betweenesscentrality', path))), 70)
 
-    with open(path) as file:
-        reader = csv.DictReader(file, delimiter=',')
-        btw = [float(line['betweenesscentrality']) for line in reader]
+
+def plot_betweenness(btw_x: np.ndarray, btw_y: np.ndarray) -> None:
+    plt = common.pyplot()
 
     plt.figure()
-    btw_x, btw_y = log_binning(dict(Counter(btw)), 70)
     plt.scatter(btw_x, btw_y, c='r', marker='s', s=25, label='')
     plt.xscale('log')
     plt.yscale('log')
     plt.title('Betweenness centrality distribution')
     plt.xlabel('Betweenness centrality')
     plt.ylabel('Count')
+
+
+def betweenness_distribution_from_gephi(path: Optional[str] = None) -> None:
+    plt = common.pyplot()
+
+    plot_betweenness(*betweenness_binned(path))
     plt.savefig(os.path.join(common.FIGURES_FOLDER, 'betweenness_distribution.png'))
 
 
@@ -162,66 +215,147 @@ def graph_from_gephi_edge_list(path: str) -> nx.Graph:
 
 
 def all_paths_from(graph: nx.Graph, from_idx: int) -> List[List[float]]:
-    nodes = graph.nodes()
-    print(f'nodes: {from_idx}/{len(nodes)}')
+    nodes = list(graph.nodes())
     distances: List[float] = []
     for to_idx in range(from_idx + 1, len(nodes)):
         try:
             distances.append(nx.shortest_path_length(graph, nodes[from_idx], nodes[to_idx]))
         except nx.NetworkXException:
-            print(f'No path for ({from_idx}, {to_idx})')
+            instrumentation.count('unreachable_pairs')
 
+    instrumentation.count('bfs_runs', len(nodes) - from_idx - 1)
     return [distances]
 
 
-def calculate_shortest_paths(graph: nx.Graph) -> None:
-    cpu_count = multiprocessing.cpu_count()
-    print(f'CPU count: {cpu_count}')
-    with Pool(multiprocessing.cpu_count()) as p:
-        # this will take awhile
-        distances = p.starmap(all_paths_from, zip(repeat(graph), [i for i in range(len(graph.nodes()))]))
+def _all_paths_task(args: Tuple[nx.Graph, int, bool]) -> Tuple[List[List[float]], Optional[TraceState]]:
+    graph, from_idx, traced = args
+    return instrumentation.run_in_worker(traced, all_paths_from, graph, from_idx)
+
+
+def _store_chunk(chunks: Dict[int, List], checkpoint_dir: Optional[str], idx: int, items: List) -> None:
+    if checkpoint_dir is None:
+        chunks[idx] = items
+    else:
+        checkpoint.save_chunk(checkpoint_dir, idx, items)
+
+
+def _load_chunk(chunks: Dict[int, List], checkpoint_dir: Optional[str], idx: int) -> List:
+    if checkpoint_dir is None:
+        return chunks[idx]
+    return checkpoint.load_chunk(checkpoint_dir, idx)
+
+
+def calculate_shortest_paths(graph: nx.Graph, path: Optional[str] = None, checkpoint_dir: Optional[str] = None,
+                             sources_per_chunk: int = DEFAULT_SOURCES_PER_CHUNK) -> None:
+    """
+    :param checkpoint_dir: Folder to save finished chunks of source nodes to; chunks already there
+                           are not recalculated, so an interrupted run can be restarted with the same folder
+    :param sources_per_chunk: Number of source nodes per chunk
+    """
+    if path is None:
+        path = common.DISTANCES_PATH
 
-    print(len(distances))
+    nodes_count = len(graph.nodes())
+    chunks_count = math.ceil(nodes_count / sources_per_chunk)
 
-    with open(os.path.join(common.DATA_FOLDER, 'dist.txt'), 'w') as file_handler:
-        for item in distances:
-            file_handler.write(f'{item}\n')
+    done_chunks: Set[int] = set()
+    if checkpoint_dir is not None:
+        params = {'nodes': nodes_count, 'edges': graph.size(), 'graph': checkpoint.graph_fingerprint(graph),
+                  'sources_per_chunk': sources_per_chunk}
+        done_chunks = checkpoint.prepare_chunks(checkpoint_dir, params)
+    pending = [idx for idx in range(nodes_count) if idx // sources_per_chunk not in done_chunks]
 
+    cpu_count = multiprocessing.cpu_count()
+    traced = instrumentation.is_enabled()
+    tasks = zip(repeat(graph), pending, repeat(traced))
+
+    chunks: Dict[int, List] = {}
+    distances = []
+    with instrumentation.span('calculate_shortest_paths', nodes=nodes_count, cpu_count=cpu_count):
+        with Pool(cpu_count) as p:
+            # this will take awhile
+            chunk_size = max(1, len(pending) // (4 * cpu_count))
+            for from_idx, (item, trace) in zip(pending, p.imap(_all_paths_task, tasks, chunk_size)):
+                instrumentation.absorb(trace)
+                distances.append(item)
+                if from_idx + 1 == nodes_count or (from_idx + 1) % sources_per_chunk == 0:
+                    _store_chunk(chunks, checkpoint_dir, from_idx // sources_per_chunk, distances)
+                    distances = []
+                instrumentation.progress('shortest_paths', from_idx + 1, nodes_count)
+
+    with checkpoint.atomic_open(path) as file_handler:
+        for idx in range(chunks_count):
+            for item in _load_chunk(chunks, checkpoint_dir, idx):
+                file_handler.write(f'{item}\n')
+
+    if checkpoint_dir is not None:
+        checkpoint.remove_chunks(checkpoint_dir)
+
+
+def distances_counter(path: Optional[str] = None) -> Counter:
+    if path is None:
+        path = common.DISTANCES_PATH
 
-def shortest_paths_distribution() -> None:
     dist_by_val: Counter = Counter()
 
-    with open(os.path.join(common.DATA_FOLDER, 'dist.txt'), 'r') as file:
-        idx = 0
-        for line in file:
-            if idx % 10 == 0 and idx != 0:
-                print(idx)
+    with open(path, 'r') as file:
+        for idx, line in enumerate(file, 1):
             data = ast.literal_eval(line)[0]
             for dist in data:
                 dist_by_val[dist] += 1
+            instrumentation.progress('shortest_paths_distribution', idx)
+
+    return dist_by_val
 
-            idx += 1
 
-    dist_x, dist_y = log_binning(dict(dist_by_val), 50)
+def distances_binned(dist_by_val: Counter) -> Binned:
+    return log_binning(dict(dist_by_val), 50)
+
+
+def plot_distances(dist_x: np.ndarray, dist_y: np.ndarray, title: str = 'Distance Distribution') -> None:
+    plt = common.pyplot()
 
     plt.figure()
     plt.scatter(dist_x, dist_y, c='r', marker='s', s=25, label='')
     plt.yscale('log')
-    plt.title('Distance Distribution')
+    plt.title(title)
     plt.xlabel('d')
     plt.ylabel('Count')
+
+
+def shortest_paths_distribution(dist_by_val: Optional[Counter] = None) -> None:
+    """
+    :param dist_by_val: Number of pairs at every distance, e.g. hyperanf's NeighbourhoodFunction.histogram();
+                        read from dist.txt by default
+    """
+    plt = common.pyplot()
+
+    if dist_by_val is None:
+        dist_by_val = distances_counter()
+
+    plot_distances(*distances_binned(dist_by_val))
     plt.savefig(os.path.join(common.FIGURES_FOLDER, 'distances_distribution.png'))
 
 
-def assortativity_distribution(graph: nx.Graph) -> None:
+def assortativity_binned(graph: nx.Graph) -> Binned:
     assorts = sorted(nx.average_degree_connectivity(graph).items())
-    assort_x, assort_y = log_binning(dict(assorts), 40)
+    return log_binning(dict(assorts), 40)
+
+
+def plot_assortativity(assort_x: np.ndarray, assort_y: np.ndarray) -> None:
+    plt = common.pyplot()
 
     plt.figure()
     plt.scatter(assort_x, assort_y, c='r', marker='s', s=25, label='')
     plt.title('Assortativity')
     plt.xlabel('k')
     plt.ylabel('$<k_{nn}>$')
+
+
+def assortativity_distribution(graph: nx.Graph) -> None:
+    plt = common.pyplot()
+
+    plot_assortativity(*assortativity_binned(graph))
     plt.savefig(os.path.join(common.FIGURES_FOLDER, 'assortativity.png'))
 
 
@@ -0,0 +1,237 @@
+from collections import Counter
+import math
+from typing import (
+    NamedTuple,
+    Optional
+)
+
+import numpy as np
+
+from project.emails import common
+from project.emails import csr
+from project.emails import instrumentation
+from project.emails.csr import CSR
+
+DEFAULT_REGISTERS_LOG2 = 7
+DEFAULT_SEED = 42
+# upper bound of the edges gathered at once: the working memory of a chunk is about edges_per_chunk * registers bytes
+DEFAULT_EDGES_PER_CHUNK = 1 << 16
+EFFECTIVE_DIAMETER_FRACTION = 0.9
+
+_MASK64 = np.uint64(0xFFFFFFFFFFFFFFFF)
+# 2 ** -rank for every possible register value, ranks never exceed 64 - 4 + 1
+_POWERS = 2.0 ** -np.arange(66)
+
+
+class NeighbourhoodFunction(NamedTuple):
+    """
+    Approximate neighbourhood function: values[t] is the estimated number of ordered pairs (x, y),
+    x == y included, with y reachable from x in at most t steps. relative_error is the relative standard
+    error of every value, 1.04 / sqrt(registers * runs).
+    """
+    values: np.ndarray
+    nodes_count: int
+    relative_error: float
+
+    @property
+    def lower(self) -> np.ndarray:
+        return self.values * (1 - self.relative_error)
+
+    @property
+    def upper(self) -> np.ndarray:
+        return self.values * (1 + self.relative_error)
+
+    def pairs_at(self) -> np.ndarray:
+        """
+        Estimated number of ordered pairs at every distance t >= 1, index 0 is distance 1.
+        """
+        return np.maximum(np.diff(self.values), 0)
+
+    def average_distance(self) -> float:
+        pairs = self.pairs_at()
+        if pairs.sum() == 0:
+            return math.nan
+        return float(np.dot(np.arange(1, len(pairs) + 1), pairs) / pairs.sum())
+
+    def effective_diameter(self, fraction: float = EFFECTIVE_DIAMETER_FRACTION) -> float:
+        """
+        Smallest distance, linearly interpolated, within which the given fraction of the connected pairs lie.
+        """
+        reached = self.values - self.values[0]
+        total = reached[-1]
+        if total <= 0:
+            return 0.0
+        threshold = fraction * total
+        t = int(np.searchsorted(reached, threshold))
+        if t == 0:
+            return 0.0
+        return t - 1 + float((threshold - reached[t - 1]) / (reached[t] - reached[t - 1]))
+
+    def histogram(self, ordered: bool = False) -> Counter:
+        """
+        :param ordered: Count (x, y) and (y, x) separately, leave False for undirected graphs
+        :returns: Estimated number of pairs at every distance, the format of distributions.distances_counter
+        """
+        pairs = self.pairs_at() if ordered else self.pairs_at() / 2
+        return Counter({t: int(round(count)) for t, count in enumerate(pairs.tolist(), 1) if round(count) > 0})
+
+
+def _splitmix64(values: np.ndarray) -> np.ndarray:
+    with np.errstate(over='ignore'):
+        z = values.astype(np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return (z ^ (z >> np.uint64(31))) & _MASK64
+
+
+def _bit_length(values: np.ndarray) -> np.ndarray:
+    """
+    Number of significant bits of every uint64 value, by binary search over the shifts.
+    """
+    values = values.copy()
+    lengths = np.zeros(len(values), dtype=np.int64)
+    for shift in [32, 16, 8, 4, 2, 1]:
+        high = (values >> np.uint64(shift)) > 0
+        lengths[high] += shift
+        values[high] >>= np.uint64(shift)
+    return lengths + (values > 0)
+
+
+def initial_registers(nodes_count: int, registers_log2: int = DEFAULT_REGISTERS_LOG2,
+                      seed: int = DEFAULT_SEED) -> np.ndarray:
+    """
+    :returns: (nodes, registers) HyperLogLog counters, counter x holds node x alone
+    """
+    hashes = _splitmix64(np.arange(nodes_count, dtype=np.uint64) + np.uint64(seed) * np.uint64(nodes_count))
+    buckets = (hashes & np.uint64((1 << registers_log2) - 1)).astype(np.int64)
+    remaining_bits = 64 - registers_log2
+    ranks = remaining_bits + 1 - _bit_length(hashes >> np.uint64(registers_log2))
+
+    registers = np.zeros((nodes_count, 1 << registers_log2), dtype=np.uint8)
+    registers[np.arange(nodes_count), buckets] = ranks
+    return registers
+
+
+def _alpha(registers: int) -> float:
+    return {16: 0.673, 32: 0.697, 64: 0.709}.get(registers, 0.7213 / (1 + 1.079 / registers))
+
+
+def _node_ranges(nodes_count: int, nodes_per_chunk: int) -> np.ndarray:
+    return np.unique(np.concatenate([np.arange(0, nodes_count, nodes_per_chunk), [nodes_count]]))
+
+
+def estimate_sizes(registers: np.ndarray, bounds: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    :param registers: (nodes, registers) counters
+    :param bounds: Node boundaries of the ranges estimated at once, DEFAULT_EDGES_PER_CHUNK nodes by default
+    :returns: Cardinality estimate of every counter, with the linear counting correction of the small sets
+    """
+    if bounds is None:
+        bounds = _node_ranges(len(registers), DEFAULT_EDGES_PER_CHUNK)
+
+    m = registers.shape[1]
+    sizes = np.empty(len(registers))
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        chunk = registers[start:end]
+        raw = _alpha(m) * m * m / _POWERS[chunk].sum(axis=1)
+        zeros = (chunk == 0).sum(axis=1)
+        small = (raw <= 2.5 * m) & (zeros > 0)
+        raw[small] = m * np.log(m / zeros[small])
+        sizes[start:end] = raw
+    return sizes
+
+
+def _chunks(adjacency: CSR, edges_per_chunk: int) -> np.ndarray:
+    """
+    Node boundaries of consecutive ranges holding at most edges_per_chunk nodes and about as many edges.
+    """
+    marks = np.arange(0, adjacency.edges_count, edges_per_chunk)
+    bounds = np.searchsorted(adjacency.indptr, marks, side='right') - 1
+    return np.unique(np.concatenate([bounds, _node_ranges(adjacency.nodes_count, edges_per_chunk)]))
+
+
+def _union_step(adjacency: CSR, registers: np.ndarray, updated: np.ndarray, bounds: np.ndarray) -> bool:
+    """
+    One iteration: counter x of updated becomes the union (register-wise max) of its own and its neighbours'
+    counters in registers. Both arrays are needed, updating in place would let the counters of the later chunks
+    see this iteration's values of their neighbours.
+    :returns: True if some counter changed
+    """
+    changed = False
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        updated[start:end] = registers[start:end]
+        first, last = adjacency.indptr[start], adjacency.indptr[end]
+        if first == last:
+            continue
+        nodes = np.arange(start, end)
+        nodes = nodes[adjacency.indptr[nodes + 1] > adjacency.indptr[nodes]]
+        neighbours = registers[adjacency.indices[first:last]]
+        merged = np.maximum.reduceat(neighbours, adjacency.indptr[nodes] - first, axis=0)
+        np.maximum(registers[nodes], merged, out=merged)
+        changed = changed or not np.array_equal(merged, registers[nodes])
+        updated[nodes] = merged
+    return changed
+
+
+def _single_run(adjacency: CSR, registers_log2: int, seed: int, max_iterations: Optional[int],
+                edges_per_chunk: int) -> np.ndarray:
+    registers = initial_registers(adjacency.nodes_count, registers_log2, seed)
+    updated = np.empty_like(registers)
+    bounds = _chunks(adjacency, edges_per_chunk)
+    values = [float(adjacency.nodes_count)]
+    with instrumentation.span('hyperanf', nodes=adjacency.nodes_count, registers=registers.shape[1], seed=seed):
+        while max_iterations is None or len(values) <= max_iterations:
+            changed = _union_step(adjacency, registers, updated, bounds)
+            instrumentation.count('hyperanf_edge_passes')
+            if not changed:
+                break
+            registers, updated = updated, registers
+            values.append(float(estimate_sizes(registers, bounds).sum()))
+            instrumentation.progress('hyperanf', len(values) - 1, pairs=int(values[-1]))
+    return np.maximum.accumulate(np.asarray(values))
+
+
+def hyperanf(adjacency: CSR, registers_log2: int = DEFAULT_REGISTERS_LOG2, runs: int = 1, seed: int = DEFAULT_SEED,
+             max_iterations: Optional[int] = None,
+             edges_per_chunk: int = DEFAULT_EDGES_PER_CHUNK) -> NeighbourhoodFunction:
+    """
+    :param adjacency: Adjacency, the balls follow the edges from source to target
+    :param registers_log2: log2 of the HyperLogLog registers per node, between 4 and 16;
+                           every extra bit halves the variance and doubles the memory
+    :param runs: Number of independent runs (seeds seed, seed + 1, ...) to average, divides the error by sqrt(runs)
+    :param seed: Seed of the node hashes of the first run
+    :param max_iterations: Stop after this many iterations, by default when no counter changes any more
+    :param edges_per_chunk: Edges (and at most as many nodes) processed at once by an iteration
+    :returns: Approximate neighbourhood function; every run takes one pass over the edges per distance
+              and two register arrays of nodes * 2 ** registers_log2 bytes, the current and the next distance,
+              besides the working memory of one chunk
+    """
+    if not 4 <= registers_log2 <= 16:
+        raise ValueError(f'registers_log2 must be between 4 and 16, got {registers_log2}')
+
+    results = [_single_run(adjacency, registers_log2, seed + run, max_iterations, edges_per_chunk)
+               for run in range(runs)]
+    # a run that converged earlier stays at its last value
+    length = max(len(values) for values in results)
+    padded = [np.pad(values, (0, length - len(values)), mode='edge') for values in results]
+    return NeighbourhoodFunction(np.mean(padded, axis=0), adjacency.nodes_count,
+                                 1.04 / math.sqrt((1 << registers_log2) * runs))
+
+
+def adjacency_from_gephi_edge_list(path: Optional[str] = None) -> CSR:
+    """
+    Undirected adjacency of the graph used by calculate_shortest_paths.
+    """
+    if path is None:
+        path = common.REDUCED_GRAPH_PATH
+
+    _, adjacency = csr.undirected_from_edges(csr.edges_from_file(path, delimiter=' '))
+    return adjacency
+
+
+if __name__ == '__main__':
+    function = hyperanf(adjacency_from_gephi_edge_list(), runs=4)
+    print(f'neighbourhood function: {function.values.round().astype(np.int64).tolist()}')
+    print(f'relative error: {round(function.relative_error, 4)}')
+    print(f'average distance: {round(function.average_distance(), 3)}; '
+          f'effective diameter: {round(function.effective_diameter(), 3)}')
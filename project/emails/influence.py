@@ -0,0 +1,327 @@
+import csv
+import hashlib
+import heapq
+import os
+from typing import (
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple
+)
+
+import numpy as np
+
+from project.emails import checkpoint
+from project.emails import common
+from project.emails import csr
+from project.emails import instrumentation
+from project.emails.csr import CSR
+from project.emails.directed import (
+    DirectedGraph,
+    run_directed_spread_simulation
+)
+
+DEFAULT_SAMPLES = 1000
+DEFAULT_SEED = 42
+INFLUENCE_CACHE_FOLDER = os.path.join(common.CACHE_FOLDER, 'influence')
+GEPHI_CENTRALITIES = ['betweenesscentrality', 'eigencentrality', 'closnesscentrality']
+
+
+class RRSets(NamedTuple):
+    """
+    Reverse-reachable sets stored back to back: set i is nodes[indptr[i]:indptr[i + 1]].
+    """
+    indptr: np.ndarray
+    nodes: np.ndarray
+    nodes_count: int
+
+    @property
+    def sets_count(self) -> int:
+        return len(self.indptr) - 1
+
+    def head(self, count: int) -> 'RRSets':
+        return RRSets(self.indptr[:count + 1], self.nodes[:self.indptr[count]], self.nodes_count)
+
+
+class SeedSelection(NamedTuple):
+    seeds: List[int]
+    spreads: List[float]
+
+
+def directed_graph_from_gephi_edge_list(path: Optional[str] = None) -> DirectedGraph:
+    """
+    The undirected graph used by sir_model, as a DirectedGraph with both directions of every edge.
+    """
+    if path is None:
+        path = common.REDUCED_GRAPH_PATH
+
+    labels, adjacency = csr.undirected_from_edges(csr.edges_from_file(path, delimiter=' '))
+    return DirectedGraph(adjacency, adjacency, labels)
+
+
+def directed_graph_fingerprint(graph: DirectedGraph) -> str:
+    """
+    Hash of the adjacency arrays and the labels, identifies the graph of cached samples.
+    """
+    digest = hashlib.sha256()
+    for array in [graph.forward.indptr, graph.forward.indices, graph.reverse.indptr, graph.reverse.indices,
+                  graph.labels]:
+        digest.update(np.ascontiguousarray(array, dtype=np.int64).tobytes())
+    return digest.hexdigest()
+
+
+def seed_labels(graph: DirectedGraph, seeds: List[int]) -> List[int]:
+    """
+    :returns: Original node ids of the seed indexes, the nodes of the networkx graph used by sir_model
+    """
+    return graph.labels[np.asarray(seeds, dtype=np.int64)].tolist()
+
+
+def _live_probabilities(durations: np.ndarray, beta: float) -> np.ndarray:
+    return 1 - (1 - beta) ** durations
+
+
+def sample_rr_sets(graph: DirectedGraph, beta: float, alpha: float, count: int = DEFAULT_SAMPLES,
+                   seed: int = DEFAULT_SEED) -> RRSets:
+    """
+    :param graph: Graph the infection spreads on
+    :param beta: specifies the rate of infection (movement from S to I)
+    :param alpha: specifies the rate of removal (movement from I to R)
+    :param count: Number of sets to sample
+    :param seed: Seed of the random generator
+    The final outbreak of sir_model.transmission_model_factory(beta, alpha) is a live-edge percolation:
+    an infected node u stays infected T_u ~ Geometric(alpha) steps and infects each neighbour
+    with probability 1 - (1 - beta) ** T_u. A reverse-reachable set is the set of nodes that
+    would infect a uniformly random target through live edges; the durations are drawn lazily,
+    once per node and set, so only the explored part of the graph costs anything.
+    """
+    rng = np.random.RandomState(seed)
+    n = graph.forward.nodes_count
+    visited = np.full(n, -1, dtype=np.int64)
+    drawn = np.full(n, -1, dtype=np.int64)
+    durations = np.zeros(n, dtype=np.float64)
+
+    indptr = np.zeros(count + 1, dtype=np.int64)
+    members: List[np.ndarray] = []
+    with instrumentation.span('sample_rr_sets', count=count):
+        for idx in range(count):
+            frontier = np.array([rng.randint(n)], dtype=np.int64)
+            visited[frontier] = idx
+            found = [frontier]
+            while len(frontier):
+                _, infectors = csr.neighbours_of(graph.reverse, frontier)
+                infectors = infectors[visited[infectors] != idx]
+                fresh = np.unique(infectors[drawn[infectors] != idx])
+                drawn[fresh] = idx
+                durations[fresh] = _durations(rng, alpha, len(fresh))
+
+                live = rng.random_sample(len(infectors)) < _live_probabilities(durations[infectors], beta)
+                frontier = np.unique(infectors[live])
+                visited[frontier] = idx
+                found.append(frontier)
+                instrumentation.count('rng_draws', len(fresh) + len(infectors))
+
+            members.append(np.concatenate(found))
+            indptr[idx + 1] = indptr[idx] + len(members[-1])
+            instrumentation.progress('sample_rr_sets', idx + 1, count)
+
+    return RRSets(indptr, np.concatenate(members).astype(np.int32), n)
+
+
+def _durations(rng: np.random.RandomState, alpha: float, size: int) -> np.ndarray:
+    if alpha <= 0:
+        # never removed: the node keeps trying until every neighbour is infected
+        return np.full(size, np.inf)
+    return rng.geometric(alpha, size).astype(np.float64)
+
+
+class SampleCache:
+    """
+    RR sets by graph content and model parameters. The sets do not depend on k, and a request for fewer sets
+    than cached reuses the first ones, so neither changing k nor the sample size resamples.
+    With a folder the sets are also stored as artifacts and survive between runs.
+    """
+
+    def __init__(self, folder: Optional[str] = INFLUENCE_CACHE_FOLDER) -> None:
+        self.folder = folder
+        self.samples: Dict[Tuple, RRSets] = {}
+
+    def _path(self, key: Tuple) -> Optional[str]:
+        if self.folder is None:
+            return None
+        return os.path.join(self.folder, '_'.join(str(value) for value in key) + '.npz')
+
+    def _load(self, key: Tuple) -> Optional[RRSets]:
+        if key in self.samples:
+            return self.samples[key]
+        path = self._path(key)
+        if path is None or not os.path.exists(path):
+            return None
+        artifact = checkpoint.load_artifact(path)
+        return RRSets(artifact['indptr'], artifact['nodes'], int(artifact['nodes_count']))
+
+    def get(self, graph: DirectedGraph, beta: float, alpha: float, count: int = DEFAULT_SAMPLES,
+            seed: int = DEFAULT_SEED) -> RRSets:
+        key = (directed_graph_fingerprint(graph)[:16], beta, alpha, seed)
+        cached = self._load(key)
+        if cached is not None and cached.sets_count >= count:
+            self.samples[key] = cached
+            return cached.head(count)
+
+        sets = sample_rr_sets(graph, beta, alpha, count, seed)
+        self.samples[key] = sets
+        path = self._path(key)
+        if path is not None:
+            checkpoint.save_artifact(path, {'indptr': sets.indptr, 'nodes': sets.nodes,
+                                            'nodes_count': np.asarray(sets.nodes_count)})
+        return sets
+
+
+def expected_outbreaks(sets: RRSets) -> np.ndarray:
+    """
+    :returns: Estimated expected outbreak size of every node infected alone
+    """
+    return sets.nodes_count * np.bincount(sets.nodes, minlength=sets.nodes_count) / sets.sets_count
+
+
+def estimated_spread(sets: RRSets, seeds: List[int]) -> float:
+    """
+    :returns: Estimated expected outbreak size of the seed set: n times the fraction of sets it hits
+    """
+    hit = np.zeros(sets.nodes_count, dtype=bool)
+    hit[seeds] = True
+    set_ids = np.repeat(np.arange(sets.sets_count), np.diff(sets.indptr))
+    covered = np.unique(set_ids[hit[sets.nodes]])
+    return sets.nodes_count * len(covered) / sets.sets_count
+
+
+def celf(sets: RRSets, k: int) -> SeedSelection:
+    """
+    :param sets: RR sets of the model
+    :param k: Number of seeds
+    :returns: Seeds in the order they were picked and the estimated spread after each pick;
+              greedy picks do not depend on k, so the first j seeds are the selection for j
+    Lazy greedy maximum coverage: marginal gains only decrease, so a node is re-evaluated
+    only when it reaches the top of the heap with a gain from an earlier round.
+    """
+    set_ids = np.repeat(np.arange(sets.sets_count), np.diff(sets.indptr))
+    order = np.argsort(sets.nodes, kind='stable')
+    sets_of_node = np.split(set_ids[order], np.cumsum(np.bincount(sets.nodes, minlength=sets.nodes_count))[:-1])
+
+    covered = np.zeros(sets.sets_count, dtype=bool)
+    heap = [(-len(node_sets), node, 0) for node, node_sets in enumerate(sets_of_node) if len(node_sets)]
+    heapq.heapify(heap)
+
+    seeds: List[int] = []
+    spreads: List[float] = []
+    covered_count = 0
+    while heap and len(seeds) < k:
+        gain, node, evaluated = heapq.heappop(heap)
+        if evaluated != len(seeds):
+            fresh_gain = int(np.count_nonzero(~covered[sets_of_node[node]]))
+            heapq.heappush(heap, (-fresh_gain, node, len(seeds)))
+            instrumentation.count('celf_evaluations')
+            continue
+
+        seeds.append(node)
+        covered[sets_of_node[node]] = True
+        covered_count -= gain
+        spreads.append(sets.nodes_count * covered_count / sets.sets_count)
+
+    return SeedSelection(seeds, spreads)
+
+
+def core_numbers(adjacency: CSR) -> np.ndarray:
+    """
+    k-core number of every node of an undirected adjacency, by peeling all nodes below k at once.
+    """
+    degrees = adjacency.degrees().copy()
+    cores = np.zeros(adjacency.nodes_count, dtype=np.int64)
+    alive = np.ones(adjacency.nodes_count, dtype=bool)
+    k = 0
+    while alive.any():
+        k = max(k, int(degrees[alive].min()))
+        peeled = np.flatnonzero(alive & (degrees <= k))
+        while len(peeled):
+            cores[peeled] = k
+            alive[peeled] = False
+            _, neighbours = csr.neighbours_of(adjacency, peeled)
+            degrees -= np.bincount(neighbours, minlength=adjacency.nodes_count)
+            peeled = np.flatnonzero(alive & (degrees <= k))
+    return cores
+
+
+def gephi_centralities(graph: DirectedGraph, path: Optional[str] = None) -> Dict[str, np.ndarray]:
+    """
+    :returns: Centralities computed by Gephi, indexed like the graph; nodes missing in the file get -inf
+    """
+    if path is None:
+        path = common.GEPHI_METRICS
+
+    centralities = {name: np.full(len(graph.labels), -np.inf) for name in GEPHI_CENTRALITIES}
+    with open(path) as file:
+        for line in csv.DictReader(file, delimiter=','):
+            idx = np.searchsorted(graph.labels, int(line['Id']))
+            if idx < len(graph.labels) and graph.labels[idx] == int(line['Id']):
+                for name in GEPHI_CENTRALITIES:
+                    centralities[name][idx] = float(line[name])
+    return centralities
+
+
+def top_k(scores: np.ndarray, k: int) -> List[int]:
+    return np.argsort(-scores, kind='stable')[:k].tolist()
+
+
+def heuristic_seeds(graph: DirectedGraph, k: int, gephi_path: Optional[str] = None) -> Dict[str, List[int]]:
+    heuristics = {
+        'degree': top_k(graph.forward.degrees().astype(float), k),
+        'k-core': top_k(core_numbers(graph.forward) + graph.forward.degrees() / (graph.forward.nodes_count + 1), k),
+    }
+    for name, scores in gephi_centralities(graph, gephi_path).items():
+        heuristics[name] = top_k(scores, k)
+    return heuristics
+
+
+def simulated_spread(graph: DirectedGraph, seeds: List[int], beta: float, alpha: float, runs: int = 20,
+                     seed: int = DEFAULT_SEED) -> float:
+    """
+    :returns: Mean number of removed nodes at the end of Monte-Carlo SIR runs started from the seeds
+    """
+    outbreaks = [run_directed_spread_simulation(graph, beta, alpha, initially_infected=seeds, seed=seed + run)[2][-1]
+                 for run in range(runs)]
+    return float(np.mean(outbreaks))
+
+
+def compare_heuristics(graph: DirectedGraph, beta: float, alpha: float, k: int,
+                       cache: Optional[SampleCache] = None, samples: int = DEFAULT_SAMPLES,
+                       simulation_runs: int = 0) -> Dict[str, Tuple[List[int], float, Optional[float]]]:
+    """
+    :param graph: Graph the infection spreads on
+    :param beta: specifies the rate of infection (movement from S to I)
+    :param alpha: specifies the rate of removal (movement from I to R)
+    :param k: Number of seeds
+    :param cache: Where to take the RR sets from
+    :param samples: Number of RR sets
+    :param simulation_runs: Number of SIR runs to check every seed set with, 0 to skip
+    :returns: For CELF and every heuristic: seed labels, spread estimated on the RR sets and simulated spread
+    """
+    if cache is None:
+        cache = SampleCache()
+    sets = cache.get(graph, beta, alpha, samples)
+
+    candidates = {'celf': celf(sets, k).seeds}
+    candidates.update(heuristic_seeds(graph, k))
+
+    results = {}
+    for name, seeds in candidates.items():
+        simulated = simulated_spread(graph, seeds, beta, alpha, simulation_runs) if simulation_runs else None
+        results[name] = (seed_labels(graph, seeds), estimated_spread(sets, seeds), simulated)
+    return results
+
+
+if __name__ == '__main__':
+    g = directed_graph_from_gephi_edge_list()
+    for method, (labels, estimated, simulated) in compare_heuristics(g, 0.05, 0.03, 10,
+                                                                     simulation_runs=10).items():
+        print(f'{method}: spread {round(estimated, 1)} (simulated {simulated}) seeds {labels}')
@@ -0,0 +1,223 @@
+from collections import Counter
+import json
+import os
+import sys
+import threading
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    Optional,
+    Tuple
+)
+
+Event = Dict[str, Any]
+TraceState = Dict[str, Any]
+ProgressCallback = Callable[[str, int, Optional[int], Dict[str, Any]], None]
+
+DEFAULT_PROGRESS_INTERVAL = 0.5
+
+
+class _State:
+    def __init__(self) -> None:
+        self.enabled = False
+        self.events: List[Event] = []
+        self.counters: Counter = Counter()
+        self.depth = 0
+        self.callbacks: List[ProgressCallback] = []
+        self.progress_interval = DEFAULT_PROGRESS_INTERVAL
+        self.last_progress: Dict[str, float] = {}
+
+    def reset(self) -> None:
+        self.events = []
+        self.counters = Counter()
+        self.depth = 0
+        self.last_progress = {}
+
+
+_state = _State()
+
+
+class _Span:
+    __slots__ = ('name', 'args', 'started')
+
+    def __init__(self, name: str, args: Dict[str, Any]) -> None:
+        self.name = name
+        self.args = args
+        self.started = 0.0
+
+    def __enter__(self) -> '_Span':
+        _state.depth += 1
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        finished = time.perf_counter()
+        _state.depth -= 1
+        _state.events.append({
+            'name': self.name,
+            'ph': 'X',
+            'ts': self.started * 1e6,
+            'dur': (finished - self.started) * 1e6,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+            'depth': _state.depth,
+            'args': self.args,
+        })
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self) -> '_NullSpan':
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def enable(progress: Optional[ProgressCallback] = None,
+           progress_interval: float = DEFAULT_PROGRESS_INTERVAL) -> None:
+    """
+    :param progress: Optional callback receiving (task, done, total, info) progress reports
+    :param progress_interval: Minimal time in seconds between two reports of the same task
+    Starts collecting spans and counters. Until this is called every hook is a no-op.
+    """
+    _state.enabled = True
+    _state.progress_interval = progress_interval
+    if progress is not None:
+        _state.callbacks.append(progress)
+
+
+def disable() -> None:
+    _state.enabled = False
+    _state.callbacks = []
+
+
+def is_enabled() -> bool:
+    return _state.enabled
+
+
+def reset() -> None:
+    _state.reset()
+
+
+def span(name: str, **args: Any) -> Any:
+    """
+    :param name: Name of the timed region
+    :param args: Extra values attached to the trace event
+    Context manager timing the enclosed block; spans opened inside it become its children.
+    """
+    if not _state.enabled:
+        return _NULL_SPAN
+    return _Span(name, args)
+
+
+def count(name: str, value: int = 1) -> None:
+    """
+    The value is computed by the caller even when disabled, guard the costly ones with is_enabled().
+    """
+    if _state.enabled:
+        _state.counters[name] += value
+
+
+def counters() -> Dict[str, int]:
+    return dict(_state.counters)
+
+
+def progress(task: str, done: int, total: Optional[int] = None, **info: Any) -> None:
+    """
+    :param task: Name of the reporting loop
+    :param done: Number of finished iterations
+    :param total: Number of iterations expected, if known
+    :param info: Extra values passed to the callbacks
+    Reports progress to the registered callbacks, at most once per progress_interval
+    for every task, apart from the final iteration which is always reported.
+    """
+    if not _state.enabled or not _state.callbacks:
+        return
+
+    now = time.monotonic()
+    finished = total is not None and done >= total
+    if not finished and now - _state.last_progress.get(task, 0.0) < _state.progress_interval:
+        return
+    _state.last_progress[task] = now
+
+    for callback in _state.callbacks:
+        callback(task, done, total, info)
+
+
+def console_progress(task: str, done: int, total: Optional[int], info: Dict[str, Any]) -> None:
+    details = ' '.join(f'{key}: {value}' for key, value in info.items())
+    of_total = f'/{total}' if total is not None else ''
+    sys.stderr.write(f'\r{task}: {done}{of_total} {details}')
+    if total is not None and done >= total:
+        sys.stderr.write('\n')
+    sys.stderr.flush()
+
+
+def export() -> TraceState:
+    return {'events': list(_state.events), 'counters': dict(_state.counters)}
+
+
+def absorb(state: Optional[TraceState]) -> None:
+    """
+    :param state: Trace collected by a worker process, see run_in_worker
+    Merges the spans and counters of a worker into the current trace.
+    """
+    if state is None or not _state.enabled:
+        return
+    _state.events.extend(state['events'])
+    _state.counters.update(state['counters'])
+
+
+def run_in_worker(enabled: bool, func: Callable, *args: Any) -> Tuple[Any, Optional[TraceState]]:
+    """
+    :param enabled: Whether the parent process is tracing
+    :param func: Task to run
+    :param args: Arguments of the task
+    :returns: Result of the task and the trace it produced (None if tracing is off)
+    Wrapper for multiprocessing tasks: the trace of a forked worker starts empty,
+    so absorbing the returned state in the parent never duplicates events.
+    """
+    if not enabled:
+        return func(*args), None
+
+    _state.reset()
+    _state.enabled = True
+    _state.callbacks = []
+    with span(getattr(func, '__name__', 'task')):
+        result = func(*args)
+    return result, export()
+
+
+def dump_json(path: str) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(export(), file)
+
+
+def dump_chrome_trace(path: str) -> None:
+    """
+    :param path: Output file, can be opened in chrome://tracing or Perfetto
+    """
+    events = [{key: value for key, value in event.items() if key != 'depth'} for event in _state.events]
+
+    if events:
+        last = max(event['ts'] + event['dur'] for event in events)
+        events.append({
+            'name': 'counters',
+            'ph': 'C',
+            'ts': last,
+            'pid': os.getpid(),
+            'args': dict(_state.counters),
+        })
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
@@ -1,24 +1,28 @@
 import os
 from typing import (
     List,
+    Optional,
+    Sequence,
     Tuple
 )
 
-import matplotlib.pyplot as plt
 import networkx as nx
 
 from project.emails import common
 from project.emails.distributions import (
     average_degree,
-    degrees_distribution,
+    Binned,
+    degrees_binned,
     dump_graph,
     graph_from_gephi_edge_list
 )
 
+BA_EDGES_COUNTS = [2, 5, 10, 15]
 
-def simple_barabasi_albert(graph: nx.Graph, edges_count: int) -> nx.Graph:
+
+def simple_barabasi_albert(graph: nx.Graph, edges_count: int, seed: Optional[int] = None) -> nx.Graph:
     nodes = len(graph.nodes())
-    ba = nx.barabasi_albert_graph(nodes, edges_count)
+    ba = nx.barabasi_albert_graph(nodes, edges_count, seed=seed)
     return ba
 
 
@@ -31,16 +35,13 @@ def extended_barabasi_albert(graph: nx.Graph, path: str) -> None:
     dump_graph(ba, path)
 
 
-def extended_ba_distributions(graph: nx.Graph) -> None:
-    ba = nx.read_edgelist(common.EXTENDED_BA_PATH)
-
-    ba_deg_x, ba_deg_y = degrees_distribution(ba, show=False, return_values=True)
-    src_deg_x, src_deg_y = degrees_distribution(graph, show=False, return_values=True)
+def plot_extended_degrees(ba_degrees: Binned, source_degrees: Binned) -> None:
+    plt = common.pyplot()
 
     plt.figure()
 
-    plt.scatter(ba_deg_x, ba_deg_y, marker='s', s=25, label='Extended Barabasi-Albert')
-    plt.scatter(src_deg_x, src_deg_y, marker='s', s=25, label='Source graph')
+    plt.scatter(*ba_degrees, marker='s', s=25, label='Extended Barabasi-Albert')
+    plt.scatter(*source_degrees, marker='s', s=25, label='Source graph')
     plt.xscale('log')
     plt.yscale('log')
     plt.title('Degrees Distribution')
@@ -48,25 +49,31 @@ def extended_ba_distributions(graph: nx.Graph) -> None:
     plt.ylabel('Count')
     plt.legend()
 
+
+def extended_ba_distributions(graph: nx.Graph) -> None:
+    plt = common.pyplot()
+
+    ba = nx.read_edgelist(common.EXTENDED_BA_PATH)
+
+    plot_extended_degrees(degrees_binned(ba), degrees_binned(graph))
     plt.savefig(os.path.join(common.FIGURES_FOLDER, 'models', 'extended_ba_degrees.png'))
 
 
-def compare_degrees_distributions(source_graph: nx.Graph) -> None:
-    avg_edges = average_degree(source_graph)
-    print(f'Average degree: {round(avg_edges, 3)}')
+def ba_degrees(source_graph: nx.Graph, edges_counts: Sequence[int] = BA_EDGES_COUNTS,
+               seed: Optional[int] = None) -> List[Tuple[str, Binned]]:
+    """
+    :returns: Label and degree distribution of a Barabasi-Albert graph of the source size for every edges count
+    """
+    return [(f'Barabasi-Albert, m = {edges}', degrees_binned(simple_barabasi_albert(source_graph, edges, seed)))
+            for edges in edges_counts]
 
-    labels = []
-    degs: List[Tuple[float, float]] = []
-    for edges in [2, 5, 10, 15]:
-        deg_x, deg_y = degrees_distribution(simple_barabasi_albert(source_graph, edges), show=False, return_values=True)
 
-        labels.append(f'Barabasi-Albert, m = {edges}')
-        degs.append((deg_x, deg_y))
+def plot_degrees_comparison(source_degrees: Binned, models: List[Tuple[str, Binned]]) -> None:
+    plt = common.pyplot()
 
     plt.figure()
-    src_deg_x, src_deg_y = degrees_distribution(source_graph, show=False, return_values=True)
-    plt.plot(src_deg_x, src_deg_y, linestyle='--', linewidth=3, color='purple', label='Source graph')
-    for deg, label in zip(degs, labels):
+    plt.plot(*source_degrees, linestyle='--', linewidth=3, color='purple', label='Source graph')
+    for label, deg in models:
         deg_x, deg_y = deg
 
         plt.scatter(deg_x, deg_y, marker='s', s=25, label=label)
@@ -77,6 +84,15 @@ def compare_degrees_distributions(source_graph: nx.Graph) -> None:
     plt.xlabel('k')
     plt.ylabel('Count')
     plt.legend()
+
+
+def compare_degrees_distributions(source_graph: nx.Graph) -> None:
+    plt = common.pyplot()
+
+    avg_edges = average_degree(source_graph)
+    print(f'Average degree: {round(avg_edges, 3)}')
+
+    plot_degrees_comparison(degrees_binned(source_graph), ba_degrees(source_graph))
     plt.show()
 
 
@@ -0,0 +1,438 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
+import multiprocessing
+import os
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple
+)
+
+import numpy as np
+
+from project.emails import checkpoint
+from project.emails import common
+from project.emails.checkpoint import (
+    Artifact,
+    load_artifact,
+    save_artifact
+)
+
+# networkx and matplotlib are imported inside the tasks, a rerun with nothing to do never loads them
+
+Params = Dict[str, Any]
+
+EMAILS_FOLDER = os.path.dirname(os.path.abspath(__file__))
+SIR_RUNS = 5
+
+
+class Task(NamedTuple):
+    name: str
+    compute: Callable[[Params, Dict[str, Artifact]], Artifact]
+    inputs: List[str]
+    # modules the task calls into besides pipeline.py, which is part of every key
+    sources: List[str]
+    params: Params
+    depends: List[str]
+    plot: Optional[Callable[[Artifact, Params], None]]
+    figures: List[str]
+
+
+def _binned(binned: Any) -> Artifact:
+    x, y = binned
+    return {'x': np.asarray(x), 'y': np.asarray(y)}
+
+
+def _degrees(params: Params, deps: Dict[str, Artifact]) -> Artifact:
+    from project.emails.distributions import (
+        degrees_binned,
+        graph_from_gephi_edge_list
+    )
+
+    return _binned(degrees_binned(graph_from_gephi_edge_list(common.REDUCED_GRAPH_PATH)))
+
+
+def _components(params: Params, deps: Dict[str, Artifact]) -> Artifact:
+    from project.emails.distributions import (
+        component_fractions,
+        components_by_size,
+        graph_instance
+    )
+
+    graph = graph_instance()
+    return {'fractions': np.asarray(component_fractions(graph, components_by_size(graph)))}
+
+
+def _clustering(params: Params, deps: Dict[str, Artifact]) -> Artifact:
+    from project.emails.distributions import clustering_binned
+
+    return _binned(clustering_binned())
+
+
+def _betweenness(params: Params, deps: Dict[str, Artifact]) -> Artifact:
+    from project.emails.distributions import betweenness_binned
+
+    return _binned(betweenness_binned())
+
+
+def _distances(params: Params, deps: Dict[str, Artifact]) -> Artifact:
+    from project.emails.distributions import (
+        distances_binned,
+        distances_counter
+    )
+
+    return _binned(distances_binned(distances_counter()))
+
+
+def _approximate_distances(params: Params, deps: Dict[str, Artifact]) -> Artifact:
+    from project.emails.distributions import distances_binned
+    from project.emails.hyperanf import (
+        adjacency_from_gephi_edge_list,
+        hyperanf
+    )
+
+    function = hyperanf(adjacency_from_gephi_edge_list(common.REDUCED_GRAPH_PATH), params['registers_log2'],
+                        params['runs'], params['seed'])
+    artifact = _binned(distances_binned(function.histogram()))
+    artifact['neighbourhood'] = function.values
+    artifact['summary'] = np.asarray([function.average_distance(), function.effective_diameter(),
+                                      function.relative_error])
+    return artifact
+
+
+def _assortativity(params: Params, deps: Dict[str, Artifact]) -> Artifact:
+    from project.emails.distributions import (
+        assortativity_binned,
+        graph_from_gephi_edge_list
+    )
+
+    return _binned(assortativity_binned(graph_from_gephi_edge_list(common.REDUCED_GRAPH_PATH)))
+
+
+def _models(params: Params, deps: Dict[str, Artifact]) -> Artifact:
+    from project.emails.distributions import graph_from_gephi_edge_list
+    from project.emails.model import ba_degrees
+
+    graph = graph_from_gephi_edge_list(common.REDUCED_GRAPH_PATH)
+    models = ba_degrees(graph, params['edges'], seed=params['seed'])
+
+    artifact = {'x_source': deps['degrees']['x'], 'y_source': deps['degrees']['y'],
+                'labels': np.asarray([label for label, _ in models])}
+    for idx, (_, (deg_x, deg_y)) in enumerate(models):
+        artifact[f'x_{idx}'], artifact[f'y_{idx}'] = np.asarray(deg_x), np.asarray(deg_y)
+    return artifact
+
+
+def _robustness(params: Params, deps: Dict[str, Artifact]) -> Artifact:
+    from project.emails.robustness import read_robustness_history
+
+    attack_history, fail_history = read_robustness_history(num_of_runs=params['runs'])
+    artifact = {'attack': np.asarray(attack_history)}
+    for run, history in enumerate(fail_history):
+        artifact[f'fail_{run}'] = np.asarray(history)
+    return artifact
+
+
+def _sir(params: Params, deps: Dict[str, Artifact]) -> Artifact:
+    from project.emails.sir_model import read_sir_history
+
+    artifact = {}
+    for experiment in params['experiments']:
+        for run in range(1, params['runs'] + 1):
+            time_steps, susceptible, infected, recovered = read_sir_history(common.sir_history_path(experiment, run))
+            artifact[f'{experiment}_{run}_T'] = np.asarray(time_steps)
+            for state, values in zip('SIR', [susceptible, infected, recovered]):
+                artifact[f'{experiment}_{run}_{state}'] = np.asarray(values)
+    return artifact
+
+
+def _plot_degrees(artifact: Artifact, params: Params) -> None:
+    from project.emails.distributions import plot_degrees
+
+    plot_degrees(artifact['x'], artifact['y'])
+
+
+def _plot_components(artifact: Artifact, params: Params) -> None:
+    from project.emails.distributions import plot_components
+
+    plot_components(artifact['fractions'].tolist(), params['fractions_to'])
+
+
+def _plot_clustering(artifact: Artifact, params: Params) -> None:
+    from project.emails.distributions import plot_clustering
+
+    plot_clustering(artifact['x'], artifact['y'])
+
+
+def _plot_betweenness(artifact: Artifact, params: Params) -> None:
+    from project.emails.distributions import plot_betweenness
+
+    plot_betweenness(artifact['x'], artifact['y'])
+
+
+def _plot_distances(artifact: Artifact, params: Params) -> None:
+    from project.emails.distributions import plot_distances
+
+    plot_distances(artifact['x'], artifact['y'], params['title'])
+
+
+def _plot_assortativity(artifact: Artifact, params: Params) -> None:
+    from project.emails.distributions import plot_assortativity
+
+    plot_assortativity(artifact['x'], artifact['y'])
+
+
+def _plot_models(artifact: Artifact, params: Params) -> None:
+    from project.emails.model import plot_degrees_comparison
+
+    models = [(str(label), (artifact[f'x_{idx}'], artifact[f'y_{idx}']))
+              for idx, label in enumerate(artifact['labels'])]
+    plot_degrees_comparison((artifact['x_source'], artifact['y_source']), models)
+
+
+def _plot_robustness(artifact: Artifact, params: Params) -> None:
+    from project.emails.robustness import plot_robustness_history
+
+    fail_history = [artifact[f'fail_{run}'].tolist() for run in range(params['runs'])]
+    plot_robustness_history(artifact['attack'].tolist(), fail_history)
+
+
+def _sir_figure(experiment: str, run: int) -> str:
+    # the first run keeps the name of the original figure of the experiment
+    suffix = '' if run == 1 else f'_{run}'
+    return os.path.join('models', f'sir_{experiment}{suffix}.png')
+
+
+def _plot_sir(artifact: Artifact, params: Params) -> None:
+    from project.emails.sir_model import plot_sir_history
+
+    for experiment, (alpha, beta) in params['experiments'].items():
+        for run in range(1, params['runs'] + 1):
+            susceptible, infected, recovered = [artifact[f'{experiment}_{run}_{state}'].tolist() for state in 'SIR']
+            plot_sir_history(int(artifact[f'{experiment}_{run}_T']), susceptible, infected, recovered, alpha, beta)
+            _save_figure(_sir_figure(experiment, run))
+
+
+def default_tasks() -> List[Task]:
+    robustness_inputs = [common.ROBUSTNESS_ATTACK_HISTORY, common.ROBUSTNESS_FAIL_HISTORY]
+    # alpha and beta of every experiment, as in sir_model.main
+    sir_experiments = {'exp_1': [0.05, 0.03], 'exp_2': [0.6, 0.2]}
+    sir_runs = [(exp, run) for exp in sir_experiments for run in range(1, SIR_RUNS + 1)]
+
+    return [
+        Task('degrees', _degrees, [common.REDUCED_GRAPH_PATH], ['distributions.py'], {}, [],
+             _plot_degrees, ['degrees_distribution.png']),
+        Task('components', _components, [common.GRAPH_PATH], ['distributions.py'],
+             {'fractions_to': 10}, [], _plot_components, ['components_distribution.png']),
+        Task('clustering', _clustering, [common.GEPHI_METRICS], ['distributions.py'], {}, [],
+             _plot_clustering, ['clustering_distribution.png']),
+        Task('betweenness', _betweenness, [common.GEPHI_METRICS], ['distributions.py'], {}, [],
+             _plot_betweenness, ['betweenness_distribution.png']),
+        Task('distances', _distances, [common.DISTANCES_PATH], ['distributions.py'],
+             {'title': 'Distance Distribution'}, [], _plot_distances, ['distances_distribution.png']),
+        Task('approximate_distances', _approximate_distances, [common.REDUCED_GRAPH_PATH],
+             ['hyperanf.py', 'csr.py', 'distributions.py'],
+             {'title': 'Approximate Distance Distribution (HyperANF)', 'registers_log2': 7, 'runs': 4, 'seed': 42},
+             [], _plot_distances, ['distances_distribution_hyperanf.png']),
+        Task('assortativity', _assortativity, [common.REDUCED_GRAPH_PATH], ['distributions.py'], {}, [],
+             _plot_assortativity, ['assortativity.png']),
+        Task('models', _models, [common.REDUCED_GRAPH_PATH], ['distributions.py', 'model.py'],
+             {'edges': [2, 5, 10, 15], 'seed': 42}, ['degrees'],
+             _plot_models, [os.path.join('models', 'simple_ba_degrees.png')]),
+        Task('robustness', _robustness, robustness_inputs, ['robustness.py'], {'runs': 5}, [],
+             _plot_robustness, ['robust.png']),
+        Task('sir', _sir, [common.sir_history_path(exp, run) for exp, run in sir_runs], ['sir_model.py'],
+             {'experiments': sir_experiments, 'runs': SIR_RUNS}, [],
+             _plot_sir, [_sir_figure(exp, run) for exp, run in sir_runs]),
+    ]
+
+
+def file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def task_key(task: Task, dependency_keys: Dict[str, str]) -> Optional[str]:
+    """
+    :param task: Task to identify
+    :param dependency_keys: Keys of the tasks it depends on
+    :returns: Hash of everything the output depends on (input files, implementing modules,
+              parameters and dependencies), None if some input file is missing
+    """
+    if any(not os.path.exists(path) for path in task.inputs):
+        return None
+
+    description = {
+        'name': task.name,
+        'params': task.params,
+        'inputs': [file_hash(path) for path in task.inputs],
+        'sources': [file_hash(os.path.join(EMAILS_FOLDER, source)) for source in ['pipeline.py'] + task.sources],
+        'depends': [dependency_keys[dep] for dep in task.depends],
+    }
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()
+
+
+def artifact_path(name: str, key: str) -> str:
+    return os.path.join(common.CACHE_FOLDER, name, f'{key}.npz')
+
+
+def _run_task(task: Task, deps: Dict[str, Artifact], path: str) -> str:
+    save_artifact(path, task.compute(task.params, deps))
+    return path
+
+
+def _save_figure(name: str) -> None:
+    plt = common.pyplot()
+
+    path = os.path.join(common.FIGURES_FOLDER, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    plt.savefig(path)
+    plt.close()
+
+
+def render_figures(task: Task, key: str, force: bool = False) -> bool:
+    """
+    :returns: True if the figures were drawn, False if they are already up to date
+    """
+    stamp = os.path.join(common.CACHE_FOLDER, task.name, 'figures.key')
+    figures_exist = all(os.path.exists(os.path.join(common.FIGURES_FOLDER, name)) for name in task.figures)
+    if not force and figures_exist and os.path.exists(stamp):
+        with open(stamp) as file:
+            if file.read() == key:
+                return False
+
+    if task.plot is not None:
+        task.plot(load_artifact(artifact_path(task.name, key)), task.params)
+        if len(task.figures) == 1:
+            _save_figure(task.figures[0])
+
+    with checkpoint.atomic_open(stamp) as file:
+        file.write(key)
+    return True
+
+
+def _select(tasks: List[Task], names: Optional[List[str]]) -> List[Task]:
+    """
+    :returns: The named tasks and everything they depend on, ValueError for an unknown name
+    """
+    if names is None:
+        return tasks
+
+    by_name = {task.name: task for task in tasks}
+    selected: List[str] = []
+    pending = list(names)
+    while pending:
+        name = pending.pop()
+        if name not in selected:
+            selected.append(name)
+            if name not in by_name:
+                raise ValueError(f'Unknown task: {name}')
+            pending.extend(by_name[name].depends)
+    return [task for task in tasks if task.name in selected]
+
+
+def _waves(tasks: List[Task]) -> List[List[Task]]:
+    waves: List[List[Task]] = []
+    done: List[str] = []
+    pending = list(tasks)
+    while pending:
+        wave = [task for task in pending if all(dep in done for dep in task.depends)]
+        if not wave:
+            raise ValueError(f'Circular dependencies between: {[task.name for task in pending]}')
+        waves.append(wave)
+        done += [task.name for task in wave]
+        pending = [task for task in pending if task not in wave]
+    return waves
+
+
+def _compute_wave(wave: List[Task], keys: Dict[str, Optional[str]], jobs: int,
+                  force: bool) -> Dict[str, str]:
+    statuses = {}
+    stale: List[Tuple[Task, str]] = []
+    for task in wave:
+        key = keys[task.name]
+        if key is None:
+            statuses[task.name] = 'missing'
+        elif force or not os.path.exists(artifact_path(task.name, key)):
+            stale.append((task, key))
+        else:
+            statuses[task.name] = 'cached'
+
+    def deps_of(task: Task) -> Dict[str, Artifact]:
+        return {dep: load_artifact(artifact_path(dep, str(keys[dep]))) for dep in task.depends}
+
+    if jobs > 1 and len(stale) > 1:
+        with ProcessPoolExecutor(min(jobs, len(stale))) as executor:
+            futures = [executor.submit(_run_task, task, deps_of(task), artifact_path(task.name, key))
+                       for task, key in stale]
+            for future in futures:
+                future.result()
+    else:
+        for task, key in stale:
+            _run_task(task, deps_of(task), artifact_path(task.name, key))
+
+    statuses.update({task.name: 'computed' for task, _ in stale})
+    return statuses
+
+
+def run_pipeline(names: Optional[List[str]] = None, figures: bool = False, jobs: Optional[int] = None,
+                 force: bool = False, tasks: Optional[List[Task]] = None) -> Dict[str, str]:
+    """
+    :param names: Tasks to run (with their dependencies), all by default
+    :param figures: Whether to draw the figures of the tasks into FIGURES_FOLDER
+    :param jobs: Number of worker processes for independent tasks, CPU count by default
+    :param force: Recompute the tasks even if their artifacts are cached
+    :param tasks: Declared tasks, default_tasks() by default
+    :returns: Status of every task: 'cached', 'computed' or 'missing' (some input file does not exist)
+    Runs only the tasks whose inputs, implementation or parameters changed since their artifact was cached.
+    """
+    if tasks is None:
+        tasks = default_tasks()
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+
+    statuses: Dict[str, str] = {}
+    keys: Dict[str, Optional[str]] = {}
+    for wave in _waves(_select(tasks, names)):
+        for task in wave:
+            dependency_keys = {dep: keys[dep] for dep in task.depends}
+            if any(key is None for key in dependency_keys.values()):
+                keys[task.name] = None
+            else:
+                keys[task.name] = task_key(task, {dep: str(key) for dep, key in dependency_keys.items()})
+        statuses.update(_compute_wave(wave, keys, jobs, force))
+
+    if figures:
+        for task in _select(tasks, names):
+            key = keys[task.name]
+            if key is not None:
+                render_figures(task, key, force)
+
+    return statuses
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Cached analysis of the emails network')
+    parser.add_argument('tasks', nargs='*', choices=[task.name for task in default_tasks()],
+                        help='tasks to run, all by default')
+    parser.add_argument('--figures', action='store_true', help='draw the figures of the tasks')
+    parser.add_argument('--jobs', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--force', action='store_true', help='ignore the cached artifacts')
+    args = parser.parse_args()
+
+    statuses = run_pipeline(args.tasks or None, args.figures, args.jobs, args.force)
+    for name, status in statuses.items():
+        print(f'{name}: {status}')
+
+
+if __name__ == '__main__':
+    main()
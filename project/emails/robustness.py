@@ -1,15 +1,21 @@
+import os
 import random
 from typing import (
+    Dict,
     List,
+    Optional,
+    Sequence,
     Tuple
 )
 
-import matplotlib.pyplot as plt
 import networkx as nx
 import numpy as np
-from tqdm import tqdm
 
+from project.emails import checkpoint
 from project.emails import common
+from project.emails import instrumentation
+
+DEFAULT_CHECKPOINT_FREQUENCY = 100
 
 
 def graph_from_gephi_edge_list(path: str) -> nx.Graph:
@@ -19,10 +25,16 @@ def graph_from_gephi_edge_list(path: str) -> nx.Graph:
         return graph
 
 
-def fail(src_graph: nx.Graph) -> nx.Graph:
+def fail(src_graph: nx.Graph, removed: Optional[List[int]] = None) -> nx.Graph:
     graph = nx.Graph(src_graph)
+    if instrumentation.is_enabled():
+        instrumentation.count('edges_touched', 2 * graph.size())
     n = random.choice(list(graph.nodes()))
     graph.remove_node(n)
+    if removed is not None:
+        removed.append(n)
+    instrumentation.count('rng_draws')
+    instrumentation.count('nodes_removed')
 
     return graph
 
@@ -30,10 +42,13 @@ def fail(src_graph: nx.Graph) -> nx.Graph:
 def attack_degree(src_graph: nx.Graph) -> nx.Graph:
     # to modify the source graph you have to unfreeze it by creating a new graph
     graph = nx.Graph(src_graph)
+    if instrumentation.is_enabled():
+        instrumentation.count('edges_touched', 2 * graph.size())
     degrees = dict(graph.degree())
     max_degree = max(degrees.values())
     max_keys = [k for k, v in degrees.items() if v == max_degree]
     graph.remove_node(max_keys[0])
+    instrumentation.count('nodes_removed')
 
     return graph
 
@@ -46,6 +61,9 @@ def diameter_and_avg_path_length(graph: nx.Graph) -> Tuple[float, float]:
         total += sum(path_length.values())
         if max(path_length.values()) > max_path_length:
             max_path_length = max(path_length.values())
+    if instrumentation.is_enabled():
+        instrumentation.count('bfs_runs', graph.order())
+        instrumentation.count('edges_touched', 2 * graph.size() * graph.order())
     try:
         avg_path_length = total / (graph.order() * (graph.order() - 1))
     except ZeroDivisionError:
@@ -56,71 +74,129 @@ def diameter_and_avg_path_length(graph: nx.Graph) -> Tuple[float, float]:
 def giant_component_fraction(graph: nx.Graph) -> float:
     components = sorted(nx.connected_component_subgraphs(graph), key=len, reverse=True)
     biggest_ga = components[0]
+    if instrumentation.is_enabled():
+        instrumentation.count('edges_touched', 2 * graph.size())
 
     return biggest_ga.size() / (len(graph.nodes()) * 1.0)
 
 
-def robustness_by_attack(src_graph: nx.Graph, nodes_to_remove: int, measure_frequency: int) -> None:
+def robustness_by_attack(src_graph: nx.Graph, nodes_to_remove: int, measure_frequency: int,
+                         history_path: Optional[str] = None) -> None:
+    if history_path is None:
+        history_path = common.ROBUSTNESS_ATTACK_HISTORY
+
     diameters_history: List[float] = []
     path_len_history: List[float] = []
     ga_fraction_history: List[float] = []
 
-    print('---- Starting Robustness Check ---- \n')
-
     graph = src_graph
-    for iteration in tqdm(range(nodes_to_remove)):
-        graph = attack_degree(graph)
+    with instrumentation.span('robustness_by_attack', nodes_to_remove=nodes_to_remove):
+        for iteration in range(nodes_to_remove):
+            graph = attack_degree(graph)
 
-        if iteration % measure_frequency == 0:
-            diameter, avg_path_len = diameter_and_avg_path_length(graph)
+            if iteration % measure_frequency == 0:
+                with instrumentation.span('measure', iteration=iteration):
+                    diameter, avg_path_len = diameter_and_avg_path_length(graph)
 
-            diameters_history.append(diameter)
-            path_len_history.append(avg_path_len)
-            ga_fraction_history.append(giant_component_fraction(graph))
+                    diameters_history.append(diameter)
+                    path_len_history.append(avg_path_len)
+                    ga_fraction_history.append(giant_component_fraction(graph))
 
-    print('---- Done: Robustness Check ---- \n')
+            instrumentation.progress('robustness_by_attack', iteration + 1, nodes_to_remove)
 
     print(diameters_history)
     print(path_len_history)
     print(ga_fraction_history)
 
-    dump_history(common.ROBUSTNESS_ATTACK_HISTORY, diameters_history, path_len_history, ga_fraction_history)
-
-
-def robustness_by_fail(src_graph: nx.Graph, number_of_runs: int, nodes_to_remove: int, measure_frequency: int) -> None:
-    diameters_history: List[List[float]] = []
-    path_len_history: List[List[float]] = []
-    ga_fraction_history: List[List[float]] = []
-
-    print('---- Starting Robustness Check ---- \n')
-
-    for _ in tqdm(range(number_of_runs)):
-        graph = src_graph
-
-        diameters_on_run: List[float] = []
-        paths_on_run: List[float] = []
-        ga_on_run: List[float] = []
-
-        for iteration in tqdm(range(nodes_to_remove)):
-            graph = fail(graph)
-            if iteration % measure_frequency == 0:
-                # diameter, avg_path_len = diameter_and_avg_path_length(graph)
-                # diameters_on_run.append(diameter)
-                # paths_on_run.append(avg_path_len)
-                ga_on_run.append(giant_component_fraction(graph))
-
-        diameters_history.append(diameters_on_run)
-        path_len_history.append(paths_on_run)
-        ga_fraction_history.append(ga_on_run)
-
-    print('---- Done: Robustness Check ---- \n')
+    dump_history(history_path, diameters_history, path_len_history, ga_fraction_history)
+
+
+def _fail_state(params: Dict, checkpoint_path: Optional[str]) -> Dict:
+    state = checkpoint.load(checkpoint_path, params) if checkpoint_path is not None else None
+    if state is None:
+        state = {
+            'params': params,
+            'run': 0,
+            'iteration': 0,
+            'removed': [],
+            'rng_state': random.getstate(),
+            'diameters_history': [],
+            'path_len_history': [],
+            'ga_fraction_history': [],
+            'ga_on_run': [],
+        }
+    random.setstate(state['rng_state'])
+    return state
+
+
+def _replay_removals(src_graph: nx.Graph, removed: List[int]) -> nx.Graph:
+    if not removed:
+        return src_graph
+    graph = nx.Graph(src_graph)
+    graph.remove_nodes_from(removed)
+    return graph
 
-    print(diameters_history)
-    print(path_len_history)
-    print(ga_fraction_history)
 
-    dump_history(common.ROBUSTNESS_FAIL_HISTORY, diameters_history,
-                 path_len_history, ga_fraction_history, fail_mode=True)
+def _save_fail_state(checkpoint_path: Optional[str], state: Dict) -> None:
+    if checkpoint_path is None:
+        return
+    state['rng_state'] = random.getstate()
+    with instrumentation.span('checkpoint'):
+        checkpoint.save(checkpoint_path, state)
+
+
+def robustness_by_fail(src_graph: nx.Graph, number_of_runs: int, nodes_to_remove: int, measure_frequency: int,
+                       history_path: Optional[str] = None, checkpoint_path: Optional[str] = None,
+                       checkpoint_frequency: int = DEFAULT_CHECKPOINT_FREQUENCY) -> None:
+    """
+    :param checkpoint_path: File to save the progress to; if it holds a checkpoint of the same job,
+                            the job resumes from it and produces the same history as an uninterrupted run
+    :param checkpoint_frequency: Number of removals between two checkpoints
+    """
+    if history_path is None:
+        history_path = common.ROBUSTNESS_FAIL_HISTORY
+
+    params = {
+        'number_of_runs': number_of_runs,
+        'nodes_to_remove': nodes_to_remove,
+        'measure_frequency': measure_frequency,
+        'nodes': src_graph.order(),
+        'edges': src_graph.size(),
+        'graph': checkpoint.graph_fingerprint(src_graph),
+    }
+    state = _fail_state(params, checkpoint_path)
+
+    while state['run'] < number_of_runs:
+        run = state['run']
+        graph = _replay_removals(src_graph, state['removed'])
+
+        with instrumentation.span('robustness_by_fail', run=run, nodes_to_remove=nodes_to_remove):
+            for iteration in range(state['iteration'], nodes_to_remove):
+                graph = fail(graph, state['removed'])
+                if iteration % measure_frequency == 0:
+                    # diameter, avg_path_len = diameter_and_avg_path_length(graph)
+                    state['ga_on_run'].append(giant_component_fraction(graph))
+
+                instrumentation.progress('robustness_by_fail', iteration + 1, nodes_to_remove, run=run)
+                state['iteration'] = iteration + 1
+                if state['iteration'] % checkpoint_frequency == 0:
+                    _save_fail_state(checkpoint_path, state)
+
+        state['diameters_history'].append([])
+        state['path_len_history'].append([])
+        state['ga_fraction_history'].append(state['ga_on_run'])
+        state.update({'run': run + 1, 'iteration': 0, 'removed': [], 'ga_on_run': []})
+        _save_fail_state(checkpoint_path, state)
+
+    print(state['diameters_history'])
+    print(state['path_len_history'])
+    print(state['ga_fraction_history'])
+
+    dump_history(history_path, state['diameters_history'],
+                 state['path_len_history'], state['ga_fraction_history'], fail_mode=True)
+
+    if checkpoint_path is not None:
+        checkpoint.remove(checkpoint_path)
 
 
 def dump_history(file_path: str, diameters: List, paths: List, ga_fractions: List, fail_mode: bool = False) -> None:
@@ -140,15 +216,23 @@ def normalized_robustness(data: List[float]) -> List[float]:
     return [value / data[0] for value in data]
 
 
-def plot_robustness() -> None:
-    with open(common.ROBUSTNESS_ATTACK_HISTORY) as attack_file:
+def read_robustness_history(attack_path: Optional[str] = None, fail_path: Optional[str] = None,
+                            num_of_runs: int = 5) -> Tuple[List[float], List[List[float]]]:
+    """
+    :returns: Normalized giant component history of the attack and of every random failure run
+    """
+    if attack_path is None:
+        attack_path = common.ROBUSTNESS_ATTACK_HISTORY
+    if fail_path is None:
+        fail_path = common.ROBUSTNESS_FAIL_HISTORY
+
+    with open(attack_path) as attack_file:
         attack_history = [float(val) for line in attack_file for val in line.split()]
 
     attack_history = normalized_robustness(attack_history)
 
-    with open(common.ROBUSTNESS_FAIL_HISTORY) as fail_file:
+    with open(fail_path) as fail_file:
         fail_history: List[List[float]] = []
-        num_of_runs = 5
 
         for run in range(num_of_runs):
             next(fail_file)
@@ -156,23 +240,41 @@ def plot_robustness() -> None:
             fail_history.append([float(val) for val in line[:-1].split(' ')])
 
             fail_history[run] = normalized_robustness(fail_history[run])
-            print(fail_history[run])
+
+    return attack_history, fail_history
+
+
+def plot_robustness_history(attack_history: Sequence[float], fail_history: Sequence[Sequence[float]]) -> None:
+    plt = common.pyplot()
 
     nodes_removed = np.linspace(0, 100, len(attack_history))
 
+    plt.figure()
     plt.plot(nodes_removed, attack_history, label='Attack by degree')
     plt.xlabel('Removed nodes, %')
     plt.ylabel('Fraction of nodes')
     plt.title('Dynamics of the fraction of nodes in giant component')
     plt.legend()
     plt.plot(nodes_removed, fail_history[0])
+
+
+def plot_robustness() -> None:
+    plt = common.pyplot()
+
+    attack_history, fail_history = read_robustness_history()
+    for run in fail_history:
+        print(run)
+
+    plot_robustness_history(attack_history, fail_history)
     plt.show()
 
 
 if __name__ == '__main__':
+    instrumentation.enable(progress=instrumentation.console_progress)
     g = graph_from_gephi_edge_list(common.REDUCED_GRAPH_PATH)
 
     robustness_by_attack(g, int(0.9 * len(g.nodes())), 50)
-    robustness_by_fail(g, 3, int(0.9 * len(g.nodes())), 50)
+    robustness_by_fail(g, 3, int(0.9 * len(g.nodes())), 50, checkpoint_path=common.ROBUSTNESS_FAIL_CHECKPOINT)
 
     plot_robustness()
+    instrumentation.dump_chrome_trace(os.path.join(common.TRACES_FOLDER, 'robustness.json'))
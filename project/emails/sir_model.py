@@ -4,19 +4,19 @@ from __future__ import unicode_literals
 from enum import Enum
 import os
 import random
-import sys
 from typing import (
     Callable,
     Dict,
     List,
+    Optional,
+    Sequence,
     Tuple
 )
 
-from matplotlib import colors
-import matplotlib.pyplot as plt
 import networkx as nx
 
 from project.emails import common
+from project.emails import instrumentation
 from project.emails.distributions import graph_from_gephi_edge_list
 
 
@@ -41,15 +41,18 @@ def reset(graph: nx.Graph) -> None:
     nx.set_node_attributes(graph, name='state', values=State.SUSCEPTIBLE)
 
 
-def initialise_infection(graph: nx.Graph, num_to_infect: int) -> NodeList:
+def initialise_infection(graph: nx.Graph, num_to_infect: int, nodes_to_infect: Optional[NodeList] = None) -> NodeList:
     """
     :param graph: Graph to infect nodes on
     :param num_to_infect: Number of nodes to infect on G
+    :param nodes_to_infect: Nodes to infect instead of a random selection; seeds picked by influence.celf
+                            are node indexes and have to be mapped with influence.seed_labels first
     Set the state of a random selection of nodes to be infected.
     numToInfect specifices how many infections to make, the nodes
     are chosen randomly from all nodes in the network
     """
-    nodes_to_infect = random.sample(graph.nodes(), num_to_infect)
+    if nodes_to_infect is None:
+        nodes_to_infect = random.sample(graph.nodes(), num_to_infect)
     for n in nodes_to_infect:
         graph.node[n]['state'] = State.INFECTED
     return nodes_to_infect
@@ -70,13 +73,18 @@ def transmission_model_factory(beta: float = 0.03, alpha: float = 0.05) -> Model
         list_of_neighbours_to_infect: List[int] = []  # list of neighbours will be infect after executing this step
         remove_myself = False  # should I change my state to removed?
         if graph.node[n]['state'] == State.INFECTED:
+            draws = 1
             # infect susceptible neighbours with probability beta
             for k in graph.neighbors(n):
                 if graph.node[k]['state'] == State.SUSCEPTIBLE:
+                    draws += 1
                     if random.random() <= beta:  # generate random number between 0 and 1
                         list_of_neighbours_to_infect.append(k)
             if random.random() <= alpha:
                 remove_myself = True
+            if instrumentation.is_enabled():
+                instrumentation.count('rng_draws', draws)
+                instrumentation.count('edges_touched', len(graph[n]))
         return list_of_neighbours_to_infect, remove_myself
 
     return m
@@ -143,13 +151,16 @@ def print_infection_stats(graph: nx.Graph) -> None:
 def run_spread_simulation(graph: nx.Graph,
                           model: ModelFactory,
                           initial_infection_count: int,
-                          run_visualise: bool = False) -> Tuple[NodeList, NodeList, NodeList, int, NodeList]:
+                          run_visualise: bool = False,
+                          nodes_to_infect: Optional[NodeList] = None
+                          ) -> Tuple[NodeList, NodeList, NodeList, int, NodeList]:
     """
     :param graph: the Graph on which to execute the infection model
     :param model: model used to infect nodes on G
     :param initial_infection_count: Number of nodes to infect on G
     :param run_visualise: if set to true a visual representation of the network
                           will be written to file at each time step
+    :param nodes_to_infect: Nodes to infect at the start instead of a random selection, see initialise_infection
     :returns : a 5-tuple containing, list of S,I,R nodes at end, the end time
                and the list of initially infected nodes (useful for visulisation)
     Runs a single simulation of infection on the graph G, using the specified model.
@@ -157,7 +168,7 @@ def run_spread_simulation(graph: nx.Graph,
     The simulation is executed until there are no more infected nodes, that is the
     infection dies out, or everyone ends up removed.
     """
-    initially_infected = initialise_infection(graph, initial_infection_count)
+    initially_infected = initialise_infection(graph, initial_infection_count, nodes_to_infect)
 
     s_results: NodeList = []
     i_results: NodeList = []
@@ -166,17 +177,18 @@ def run_spread_simulation(graph: nx.Graph,
     dt = 0
     susceptible, infected, removed = get_infection_stats(graph)
 
-    pos = nx.spring_layout(graph, k=.75)
+    # the layout is quadratic in nodes, it is only needed for the pictures
+    pos: Dict = nx.spring_layout(graph, k=.75) if run_visualise else {}
 
     while len(infected) > 0:
-        execute_one_step(graph, model)  # execute each node in the graph once
-        dt += 1  # increase time step
-        susceptible, infected, removed = get_infection_stats(graph)  # calculate SIR stats of the current time step
+        with instrumentation.span('sir_step', time_step=dt):
+            execute_one_step(graph, model)  # execute each node in the graph once
+            dt += 1  # increase time step
+            susceptible, infected, removed = get_infection_stats(graph)  # calculate SIR stats of the current time step
         s_results.append(len(susceptible))  # add S counts to our final results
         i_results.append(len(infected))  # add I counts to our final results
         r_results.append(len(removed))  # add R counts to our final results
-        sys.stderr.write(f'\rInfected: {len(infected)} time step: {dt}')
-        sys.stderr.flush()
+        instrumentation.progress('sir', dt, infected=len(infected))
 
         if run_visualise:  # If run visualise is true, we output the graph to file
             draw_network_to_file(graph, pos, dt, initially_infected)
@@ -192,6 +204,8 @@ def plot_infection(susceptible: List[int], infected: List[int], removed: List[in
     :param graph: Graph/Network of statistic to plot
     Creates a plot of the S,I,R output of a spread simulation.
     """
+    plt = common.pyplot()
+
     peak_incidence = max(infected)
     peak_time = infected.index(max(infected))
     total_infected = susceptible[0] - susceptible[-1]
@@ -224,6 +238,10 @@ def draw_network_to_file(graph: nx.Graph, pos: Dict, t: int, initially_infected:
     Draws the current state of the graph G, colouring nodes depending on their state.
     The image is saved to a png file in the images subdirectory.
     """
+    from matplotlib import colors
+
+    plt = common.pyplot()
+
     # create the layout
     states = []
     for n in graph.nodes():
@@ -248,34 +266,48 @@ def dump_sir_history(path: str, s: NodeList, i: NodeList, r: NodeList, end_time:
             file.write(f'{common.join_values(param)}\n')
 
 
+def read_sir_history(path: str) -> Tuple[int, List[int], List[int], List[int]]:
+    """
+    :returns: the end time and the S, I, R counts of every time step, as written by dump_sir_history
+    """
+    with open(path) as sir_file:
+        time_steps = int(sir_file.readline())
+        susceptible = [int(val) for val in sir_file.readline().split()]
+        infected = [int(val) for val in sir_file.readline().split()]
+        recovered = [int(val) for val in sir_file.readline().split()]
+    return time_steps, susceptible, infected, recovered
+
+
+def plot_sir_history(time_steps: int, susceptible: Sequence[int], infected: Sequence[int],
+                     recovered: Sequence[int], alpha: float, beta: float) -> None:
+    plt = common.pyplot()
+
+    max_infected = max(infected)
+
+    times = [t for t in range(time_steps)]
+
+    plt.figure()
+    plt.plot(times, susceptible, label='S')
+    plt.plot(times, infected, label='I')
+    plt.plot(times, recovered, label='R')
+    plt.hlines(max_infected, 0, time_steps, linestyles='--', label='Peak Infected')
+    plt.xlim(0, time_steps)
+    plt.xlabel('Time step')
+    plt.ylabel('Number of nodes')
+    plt.title(r'SIR model propagation with $\alpha = %.2f, \beta = %.2f$' % (alpha, beta))
+    plt.legend(loc='upper right')
+
+
 def plot_sir_model_results() -> None:
+    plt = common.pyplot()
+
     for idx in range(1, 6):
-        with open(os.path.join(common.SIR_FOLDER, 'exp_2', f'sir_history_{idx}.txt')) as sir_file:
-            time_steps = int(sir_file.readline())
-            susceptible = [int(val) for val in sir_file.readline().split()]
-            infected = [int(val) for val in sir_file.readline().split()]
-            recovered = [int(val) for val in sir_file.readline().split()]
-
-        max_infected = max(infected)
-
-        sir_file.close()
-
-        times = [t for t in range(time_steps)]
-
-        plt.figure()
-        plt.plot(times, susceptible, label='S')
-        plt.plot(times, infected, label='I')
-        plt.plot(times, recovered, label='R')
-        plt.hlines(max_infected, 0, time_steps, linestyles='--', label='Peak Infected')
-        plt.xlim(0, time_steps)
-        plt.xlabel('Time step')
-        plt.ylabel('Number of nodes')
-        plt.title(r'SIR model propagation with $\alpha = %.2f, \beta = %.2f$' % (0.6, 0.2))
-        plt.legend(loc='upper right')
+        plot_sir_history(*read_sir_history(common.sir_history_path('exp_2', idx)), 0.6, 0.2)
         plt.show()
 
 
 def main() -> None:
+    instrumentation.enable(progress=instrumentation.console_progress)
     g: nx.Graph = graph_from_gephi_edge_list(common.REDUCED_GRAPH_PATH)
 
     for exp_number in range(3, 6):
@@ -285,7 +317,7 @@ def main() -> None:
         reset(g)  # initialise all nodes to susceptible
         susceptible, infected, removed, endtime, ii = run_spread_simulation(g, m, number_initial_infections)
 
-        dump_sir_history(os.path.join(common.SIR_FOLDER, 'exp_1', f'sir_history_{exp_number}.txt'),
+        dump_sir_history(common.sir_history_path('exp_1', exp_number),
                          susceptible, infected, removed, endtime, ii)
 
         # exp_2
@@ -293,7 +325,7 @@ def main() -> None:
         number_initial_infections = 100
         reset(g)  # initialise all nodes to susceptible
         susceptible, infected, removed, endtime, ii = run_spread_simulation(g, m, number_initial_infections)
-        dump_sir_history(os.path.join(common.SIR_FOLDER, 'exp_2', f'sir_history_{exp_number}.txt'),
+        dump_sir_history(common.sir_history_path('exp_2', exp_number),
                          susceptible, infected, removed, endtime, ii)
 
 
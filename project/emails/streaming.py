@@ -0,0 +1,294 @@
+from collections import (
+    Counter,
+    deque
+)
+import math
+from typing import (
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple
+)
+
+from project.emails import common
+from project.emails import instrumentation
+
+Node = int
+EdgeEvent = Tuple[Node, Node]
+EdgeKey = Tuple[Node, Node]
+
+DEFAULT_SNAPSHOT_FREQUENCY = 10_000
+
+
+class Snapshot(NamedTuple):
+    events: int
+    nodes: int
+    edges: int
+    components: int
+    giant_fraction: float
+    triangles: int
+    power_law_exponent: float
+    degree_histogram: Dict[int, int]
+
+
+def edge_events(path: str) -> Iterator[EdgeEvent]:
+    """
+    :param path: Tab separated edge list in the format of emails.txt (the first line is skipped)
+    Reads the events lazily, the file is never loaded as a whole.
+    """
+    with open(path, 'r') as file:
+        next(file, '')
+        for line in file:
+            node_from, node_to = map(int, line.split('\t'))
+            yield node_from, node_to
+
+
+class DynamicComponents:
+    """
+    Components of an undirected graph under edge insertions and deletions: a spanning forest of the graph,
+    the component of every node and the members of every component.
+
+    A merge relabels the smaller component. Only the deletion of a forest edge can split a component:
+    the smaller of the two trees is searched, by alternating breadth-first searches from both ends,
+    for a graph edge leaving it, which then replaces the deleted one; without one the tree becomes
+    a component of its own. Both take time proportional to the smaller side.
+    """
+
+    def __init__(self) -> None:
+        self.forest: Dict[Node, Set[Node]] = {}
+        self.label: Dict[Node, int] = {}
+        self.members: Dict[int, Set[Node]] = {}
+        self._next_label = 0
+
+    @property
+    def components(self) -> int:
+        return len(self.members)
+
+    @property
+    def largest(self) -> int:
+        return max((len(members) for members in self.members.values()), default=0)
+
+    def _new_component(self, nodes: Set[Node]) -> None:
+        self.members[self._next_label] = nodes
+        for node in nodes:
+            self.label[node] = self._next_label
+        self._next_label += 1
+
+    def add(self, node: Node) -> None:
+        if node not in self.label:
+            self.forest[node] = set()
+            self._new_component({node})
+
+    def remove(self, node: Node) -> None:
+        """
+        Removes a node without edges.
+        """
+        label = self.label.pop(node)
+        del self.forest[node]
+        self.members[label].discard(node)
+        if not self.members[label]:
+            del self.members[label]
+
+    def _add_forest_edge(self, first: Node, second: Node) -> None:
+        self.forest[first].add(second)
+        self.forest[second].add(first)
+
+    def link(self, first: Node, second: Node) -> bool:
+        """
+        :returns: True if the nodes were in different components, which are now merged
+        """
+        self.add(first)
+        self.add(second)
+        kept, merged = self.label[first], self.label[second]
+        if kept == merged:
+            return False
+        if len(self.members[kept]) < len(self.members[merged]):
+            kept, merged = merged, kept
+
+        for node in self.members[merged]:
+            self.label[node] = kept
+        self.members[kept] |= self.members.pop(merged)
+        self._add_forest_edge(first, second)
+        return True
+
+    def _smaller_tree(self, first: Node, second: Node) -> Set[Node]:
+        searches = [({first}, deque([first])), ({second}, deque([second]))]
+        while True:
+            for visited, queue in searches:
+                if not queue:
+                    return visited
+                for other in self.forest[queue.popleft()]:
+                    if other not in visited:
+                        visited.add(other)
+                        queue.append(other)
+
+    def cut(self, first: Node, second: Node, adjacency: Dict[Node, Set[Node]]) -> bool:
+        """
+        :param adjacency: Adjacency of the graph without the deleted edge
+        :returns: True if the component was split
+        """
+        if second not in self.forest[first]:
+            return False
+
+        self.forest[first].discard(second)
+        self.forest[second].discard(first)
+        tree = self._smaller_tree(first, second)
+        for node in tree:
+            for other in adjacency.get(node, ()):
+                if other not in tree:
+                    self._add_forest_edge(node, other)
+                    instrumentation.count('forest_edges_replaced')
+                    return False
+
+        self.members[self.label[first]] -= tree
+        self._new_component(tree)
+        return True
+
+
+class StreamingGraph:
+    """
+    Undirected graph maintained from a stream of edge events.
+
+    Degree histogram, triangle count and the power-law exponent estimate are updated in O(1)
+    (O(min degree) for triangles) per event. Components are kept in DynamicComponents, the expiry
+    of an edge outside its spanning forest costs nothing, that of a forest edge is proportional
+    to the smaller of the two trees it leaves.
+    """
+
+    def __init__(self, window: Optional[int] = None, degree_min: int = 2) -> None:
+        """
+        :param window: Number of latest events kept in the graph, older edges expire; None keeps everything.
+                       Self-loops take their place in the window but add nothing to the graph
+        :param degree_min: Smallest degree taken into account by the power-law exponent estimate
+        """
+        self.window = window
+        self.degree_min = degree_min
+        self.events = 0
+        self.adjacency: Dict[Node, Set[Node]] = {}
+        self.multiplicity: Counter = Counter()
+        self.recent: Deque[EdgeKey] = deque()
+        self.degree_histogram: Counter = Counter()
+        self.triangles = 0
+        self.tail_nodes = 0
+        self.tail_log_sum = 0.0
+        self.components = DynamicComponents()
+
+    def _degree_changed(self, old: int, new: int) -> None:
+        for degree, sign in [(old, -1), (new, 1)]:
+            if degree == 0:
+                continue
+            self.degree_histogram[degree] += sign
+            if self.degree_histogram[degree] == 0:
+                del self.degree_histogram[degree]
+            if degree >= self.degree_min:
+                self.tail_nodes += sign
+                self.tail_log_sum += sign * math.log(degree / self.degree_min)
+
+    def _link(self, first: Node, second: Node) -> None:
+        first_neighbours = self.adjacency.setdefault(first, set())
+        second_neighbours = self.adjacency.setdefault(second, set())
+        self.triangles += len(first_neighbours & second_neighbours)
+
+        for neighbours, other in [(first_neighbours, second), (second_neighbours, first)]:
+            self._degree_changed(len(neighbours), len(neighbours) + 1)
+            neighbours.add(other)
+
+        self.components.link(first, second)
+
+    def _unlink(self, first: Node, second: Node) -> None:
+        first_neighbours = self.adjacency[first]
+        second_neighbours = self.adjacency[second]
+        first_neighbours.discard(second)
+        second_neighbours.discard(first)
+        self.triangles -= len(first_neighbours & second_neighbours)
+
+        for neighbours in [first_neighbours, second_neighbours]:
+            self._degree_changed(len(neighbours) + 1, len(neighbours))
+
+        if self.components.cut(first, second, self.adjacency):
+            instrumentation.count('components_split')
+        for node, neighbours in [(first, first_neighbours), (second, second_neighbours)]:
+            if not neighbours:
+                del self.adjacency[node]
+                self.components.remove(node)
+        instrumentation.count('edges_expired')
+
+    def add_edge(self, node_from: Node, node_to: Node) -> None:
+        """
+        Consumes one event. Repeated events (e.g. both directions of an email exchange) only
+        refresh the edge; it expires when the last of its events leaves the window. A self-loop
+        counts as an event and takes a place in the window, but adds nothing to the graph.
+        """
+        self.events += 1
+        key = (min(node_from, node_to), max(node_from, node_to))
+        if node_from != node_to:
+            self.multiplicity[key] += 1
+            if self.multiplicity[key] == 1:
+                self._link(*key)
+
+        if self.window is not None:
+            self.recent.append(key)
+            while len(self.recent) > self.window:
+                self._expire(self.recent.popleft())
+
+    def _expire(self, key: EdgeKey) -> None:
+        if key[0] == key[1]:
+            return
+
+        self.multiplicity[key] -= 1
+        if self.multiplicity[key] == 0:
+            del self.multiplicity[key]
+            self._unlink(*key)
+
+    def power_law_exponent(self) -> float:
+        """
+        Maximum likelihood estimate of the degree exponent, the estimator of distributions.power_law
+        restricted to the degrees >= degree_min.
+        """
+        if self.tail_log_sum <= 0:
+            return math.nan
+        return 1 + self.tail_nodes / self.tail_log_sum
+
+    def snapshot(self) -> Snapshot:
+        nodes = len(self.adjacency)
+        return Snapshot(
+            events=self.events,
+            nodes=nodes,
+            edges=len(self.multiplicity),
+            components=self.components.components,
+            giant_fraction=self.components.largest / nodes if nodes else 0.0,
+            triangles=self.triangles,
+            power_law_exponent=self.power_law_exponent(),
+            degree_histogram=dict(self.degree_histogram),
+        )
+
+
+def stream_snapshots(events: Iterable[EdgeEvent], snapshot_frequency: int = DEFAULT_SNAPSHOT_FREQUENCY,
+                     window: Optional[int] = None, degree_min: int = 2) -> Iterator[Snapshot]:
+    """
+    :param events: Edge events, e.g. edge_events(path) or any generator of (node_from, node_to)
+    :param snapshot_frequency: Number of events between two snapshots
+    :param window: Number of latest events kept in the graph, None keeps everything
+    :param degree_min: Smallest degree taken into account by the power-law exponent estimate
+    :returns: Summary of the graph every snapshot_frequency events and after the last one
+    """
+    graph = StreamingGraph(window, degree_min)
+    for node_from, node_to in events:
+        graph.add_edge(node_from, node_to)
+        if graph.events % snapshot_frequency == 0:
+            yield graph.snapshot()
+            instrumentation.progress('stream', graph.events)
+
+    if graph.events % snapshot_frequency != 0:
+        yield graph.snapshot()
+
+
+if __name__ == '__main__':
+    for snap in stream_snapshots(edge_events(common.GRAPH_PATH), snapshot_frequency=50_000):
+        print(f'events: {snap.events} nodes: {snap.nodes} edges: {snap.edges} components: {snap.components} '
+              f'giant: {round(snap.giant_fraction, 5)} triangles: {snap.triangles} '
+              f'gamma: {round(snap.power_law_exponent, 3)}')